@@ -1,22 +1,35 @@
 # --------------------------
 # 1️⃣ Install & import packages
 # --------------------------
-import pandas as pd
-import numpy as np
-from sklearn.metrics.pairwise import cosine_similarity
-from sentence_transformers import SentenceTransformer
+# Lightweight imports only - sentence-transformers (which drags in torch)
+# is imported by load_resources() so that Flask can bind the port
+# immediately when NLP_FAST_START is enabled.
+from nlp_scoring import (
+    EMBEDDING_MODEL_PATH, load_embedding_model, load_term_sets, select_term_sets, analyze_texts, add_timing,
+    embed_texts
+)
+from profiling import SamplingProfiler
+from coordination import create_coordinator
+from metrics import MetricsRollup
+from embedding_store import EmbeddingStore
 # from transformers import pipeline  # Removed for performance optimization
 import json
+import math
 import requests
 import os
 import time
+import threading
+import functools
+import hmac
+import socket
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
-from flask import Flask, request, jsonify
-from difflib import SequenceMatcher
-import re
+from flask import Flask, request, jsonify, g, has_request_context
 from apscheduler.schedulers.background import BackgroundScheduler
 import atexit
 
+_process_start = time.perf_counter()
+
 # --------------------------
 # 2️⃣ Time Conversion Helper Functions
 # --------------------------
@@ -41,6 +54,25 @@ def calculate_latency(original_time_str, current_time_str):
     except:
         return 0
 
+def parse_epoch_or_iso(time_str):
+    """Convert epoch seconds or an ISO time to Unix seconds. Raises ValueError for anything else."""
+    try:
+        epoch = float(time_str)
+    except (TypeError, ValueError):
+        return int(datetime.fromisoformat(str(time_str).replace('Z', '+00:00')).timestamp())
+    if not math.isfinite(epoch):
+        raise ValueError(f"Invalid epoch time: {time_str}")
+    return int(epoch)
+
+def splunk_time_to_epoch(time_str):
+    """Convert Splunk _time (ISO, simple format or epoch) to Unix seconds, now if missing"""
+    if not time_str:
+        return int(time.time())
+    try:
+        return parse_epoch_or_iso(time_str)
+    except ValueError:
+        return convert_splunk_time_to_unix(time_str)
+
 def convert_splunk_iso_to_simple(iso_time_str):
     """Convert Splunk ISO time format to simple format"""
     try:
@@ -52,161 +84,172 @@ def convert_splunk_iso_to_simple(iso_time_str):
         return iso_time_str  # Return original if parsing fails
 
 # --------------------------
-# 3️⃣ Load your data
+# 3️⃣ Model, data and startup state
 # --------------------------
-queries_df = pd.read_csv("o365_searchquery_training_full.csv")
-sensitive_terms_df = pd.read_csv("Suspect_Words.csv")
+embedding_model_path = EMBEDDING_MODEL_PATH
 
-# --------------------------
-# 3️⃣ Initialize embedding model from local directory
-# --------------------------
-embedding_model_path = "./models/all-MiniLM-L6-v2/snapshots/c9745ed1d9f207416be6d2e6f8de32d1f16199bf"
-embedding_model = SentenceTransformer(embedding_model_path)
+# Fast-start mode: bind the port first, load everything in a background thread
+FAST_START = os.getenv('NLP_FAST_START', 'false').lower() in ('1', 'true', 'yes')
 
-def get_embedding(text):
-    """
-    Returns a mean-pooled embedding for the input text.
-    """
-    return embedding_model.encode([text])[0]
+# Optional JSON config of named term sets (default: Suspect_Words.csv only)
+TERM_SETS_CONFIG = os.getenv('TERM_SETS_CONFIG', '')
 
-# --------------------------
-# 4️⃣ Precompute sensitive term embeddings once
-# --------------------------
-print("Precomputing sensitive term embeddings...")
-sensitive_embeddings = np.array([get_embedding(term) for term in sensitive_terms_df['term']])
-print("Done precomputing embeddings.")
+# Long-text mode: score texts longer than the model's max sequence length
+# (e.g. webhook _raw) as up to LONG_TEXT_MAX_WINDOWS overlapping windows
+LONG_TEXT_MODE = os.getenv('LONG_TEXT_MODE', 'false').lower() in ('1', 'true', 'yes')
+LONG_TEXT_MAX_WINDOWS = int(os.getenv('LONG_TEXT_MAX_WINDOWS', '8'))
+LONG_TEXT_WINDOW_OVERLAP = int(os.getenv('LONG_TEXT_WINDOW_OVERLAP', '32'))
 
-# --------------------------
-# 5️⃣ Enhanced similarity functions with punctuation handling
-# --------------------------
-def normalize_text(text):
-    """
-    Normalize text by removing punctuation and normalizing whitespace.
-    """
-    # Replace punctuation with spaces
-    text = re.sub(r'[^\w\s]', ' ', text.lower())
-    # Normalize multiple spaces to single space
-    text = re.sub(r'\s+', ' ', text)
-    return text.strip()
+# Persistent store of query embeddings for /similar_queries (empty = disabled)
+EMBEDDING_STORE_DIR = os.getenv('EMBEDDING_STORE_DIR', '')
+EMBEDDING_STORE_SEGMENT_ROWS = int(os.getenv('EMBEDDING_STORE_SEGMENT_ROWS', '100000'))
+EMBEDDING_STORE_SEGMENT_HOURS = int(os.getenv('EMBEDDING_STORE_SEGMENT_HOURS', '24'))
+EMBEDDING_STORE_RETENTION_DAYS = int(os.getenv('EMBEDDING_STORE_RETENTION_DAYS', '90'))
 
-def calculate_substring_similarity(query, sensitive_term):
-    """
-    Calculate substring similarity between query and sensitive term.
-    Uses normalized text to handle punctuation.
-    Returns a score between 0 and 1.
-    """
-    # Normalize both texts to handle punctuation
-    query_norm = normalize_text(query)
-    term_norm = normalize_text(sensitive_term)
-    
-    # Exact substring match on normalized text
-    if term_norm in query_norm:
-        return 1.0
-    
-    # Fuzzy substring match using SequenceMatcher on normalized text
-    matcher = SequenceMatcher(None, query_norm, term_norm)
-    match = matcher.find_longest_match(0, len(query_norm), 0, len(term_norm))
-    
-    if match.size > 0:
-        # Calculate similarity based on match length
-        similarity = match.size / len(term_norm)
-        return min(similarity, 1.0)
-    
-    return 0.0
+# Token required by /admin endpoints (X-Admin-Token header); unset = /admin disabled
+ADMIN_TOKEN = os.getenv('NLP_ADMIN_TOKEN', '')
+# Upper bound on a single /admin/profile run and lower bound on its sampling interval
+PROFILE_MAX_SECONDS = 300
+PROFILE_MIN_INTERVAL_MS = 1
 
-def calculate_word_overlap_similarity(query, sensitive_term):
+# Populated by load_resources()
+embedding_model = None
+term_sets = {}
+embedding_store = None
+
+# Readiness state, reported by /health/ready
+resources_ready = threading.Event()
+startup_error = None
+startup_timings = {}
+
+def load_resources():
     """
-    Calculate word-level overlap similarity using Jaccard similarity.
-    Uses normalized text to handle punctuation.
+    Import heavy libraries, load the model, load the term sets with
+    their embeddings and run a dummy encode so the first real request does not
+    pay for kernel initialisation. Each phase is timed into startup_timings.
     """
-    # Use normalized text for better word extraction
-    query_norm = normalize_text(query)
-    term_norm = normalize_text(sensitive_term)
-    
-    query_words = set(query_norm.split())
-    term_words = set(term_norm.split())
-    
-    if not query_words or not term_words:
-        return 0.0
-    
-    intersection = query_words.intersection(term_words)
-    union = query_words.union(term_words)
-    
-    return len(intersection) / len(union) if union else 0.0
+    global embedding_model, term_sets, embedding_store
+    global startup_error
+
+    try:
+        phase_start = time.perf_counter()
+        import sentence_transformers  # noqa: F401 - pulls in torch, timed here
+        startup_timings['import_seconds'] = round(time.perf_counter() - phase_start, 3)
+
+        # Initialize embedding model from local directory
+        phase_start = time.perf_counter()
+        embedding_model = load_embedding_model(embedding_model_path)
+        startup_timings['model_load_seconds'] = round(time.perf_counter() - phase_start, 3)
+
+        # Load term sets and precompute (or load) their embeddings once
+        print("Loading sensitive term sets...")
+        phase_start = time.perf_counter()
+        term_sets = load_term_sets(embedding_model, TERM_SETS_CONFIG)
+        startup_timings['term_embedding_seconds'] = round(time.perf_counter() - phase_start, 3)
+        print("Done loading term sets.")
+        
+        if EMBEDDING_STORE_DIR:
+            embedding_store = EmbeddingStore(
+                EMBEDDING_STORE_DIR,
+                embedding_model.get_sentence_embedding_dimension(),
+                segment_rows=EMBEDDING_STORE_SEGMENT_ROWS,
+                segment_seconds=EMBEDDING_STORE_SEGMENT_HOURS * 3600,
+                retention_seconds=EMBEDDING_STORE_RETENTION_DAYS * 86400
+            )
+            print(f"Embedding store opened at {EMBEDDING_STORE_DIR}: {embedding_store.stats()}")
+
+        # Warm-up encode so lazy kernel/graph initialisation happens now
+        phase_start = time.perf_counter()
+        embedding_model.encode(["warm up query"])
+        startup_timings['warmup_encode_seconds'] = round(time.perf_counter() - phase_start, 3)
 
-def enhanced_similarity_score(query, sensitive_term, semantic_score):
+        startup_timings['total_seconds'] = round(time.perf_counter() - _process_start, 3)
+        resources_ready.set()
+        print(f"✅ Model and term index ready: {startup_timings}")
+
+    except Exception as e:
+        startup_error = str(e)
+        print(f"❌ Error loading model and data: {e}")
+
+# --------------------------
+# 5️⃣ Per-request timing (opt-in via X-Debug-Timing header or ?debug_timing=1)
+# --------------------------
+def request_timings():
     """
-    Calculate enhanced similarity score combining substring, word overlap, and semantic similarity.
+    Timings dict for the current request when debug timing was requested,
+    otherwise None (timing disabled, callers skip all bookkeeping).
     """
-    # Get substring similarity
-    substring_score = calculate_substring_similarity(query, sensitive_term)
-    
-    # Get word overlap similarity
-    word_overlap_score = calculate_word_overlap_similarity(query, sensitive_term)
-    
-    # Weighted combination: prioritize substring matches, then word overlap, then semantic
-    if substring_score > 0.8:  # Strong substring match
-        return max(substring_score, semantic_score * 0.7)
-    elif word_overlap_score > 0.6:  # Good word overlap
-        return max(word_overlap_score, semantic_score * 0.8)
-    else:  # Fall back to semantic similarity
-        return semantic_score
+    if has_request_context():
+        return g.get('timings')
+    return None
 
-def find_all_sensitive_terms(query, sensitive_terms_df, sensitive_embeddings, threshold=0.5):
+def timed_stage(stage):
     """
-    Find all sensitive terms in a query that exceed the similarity threshold.
-    Returns a list of (term, score) tuples.
+    Decorator that adds the wrapped call's duration to the request timings
+    under `stage` when debug timing is on.
     """
-    # Compute semantic similarities for all terms
-    query_embedding = get_embedding(query).reshape(1, -1)
-    semantic_similarities = cosine_similarity(query_embedding, sensitive_embeddings)
-    
-    matches = []
-    for i, term in enumerate(sensitive_terms_df['term']):
-        semantic_score = semantic_similarities[0][i]
-        enhanced_score = enhanced_similarity_score(query, term, semantic_score)
-        
-        if enhanced_score >= threshold:
-            matches.append((term, enhanced_score))
-    
-    # Sort by score (highest first)
-    matches.sort(key=lambda x: x[1], reverse=True)
-    return matches
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            timings = request_timings()
+            if timings is None:
+                return func(*args, **kwargs)
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                add_timing(timings, stage, started)
+        return wrapper
+    return decorator
 
 # --------------------------
-# 6️⃣ Main analysis function
+# 6️⃣ Main analysis function (scoring lives in nlp_scoring.py)
 # --------------------------
-def analyze_query(query_text):
+def analyze_query(query_text, term_set_names=None, record=None):
     """
     Enhanced analysis with punctuation handling and multiple term detection.
     Returns:
-        - most similar sensitive term
+        - most similar sensitive term (across the selected term sets)
         - enhanced similarity score
         - all detected sensitive terms (if multiple)
+        - per-term-set results keyed by set name
     """
-    # Find all sensitive terms that exceed threshold
-    all_matches = find_all_sensitive_terms(query_text, sensitive_terms_df, sensitive_embeddings, threshold=0.5)
-    
-    if not all_matches:
-        return {
-            "query": query_text,
-            "most_similar_term": "none",
-            "similarity_score": 0.0,
-            "all_detected_terms": []
-        }
-    
-    # Get the highest scoring term
-    most_similar_term, max_similarity = all_matches[0]
-    
-    # Prepare all detected terms for the response
-    all_detected_terms = [{"term": term, "score": float(score)} for term, score in all_matches]
+    return analyze_queries([query_text], term_set_names, records=[record] if record else None)[0]
 
-    return {
-        "query": query_text,
-        "most_similar_term": most_similar_term,
-        "similarity_score": float(max_similarity),
-        "all_detected_terms": all_detected_terms
-    }
+def analyze_queries(query_texts, term_set_names=None, records=None):
+    """
+    Batched version of analyze_query: encodes all queries in one model call
+    and scores each embedding against every selected term set.
+    Returns one result per query, in input order.
+
+    records (optional, aligned with query_texts) are the source events; their
+    'user' and '_time' are stored with the query embeddings when the
+    embedding store is enabled.
+    """
+    query_texts = list(query_texts)
+    results = analyze_texts(embedding_model, query_texts, select_term_sets(term_sets, term_set_names),
+                            timings=request_timings(),
+                            max_windows=LONG_TEXT_MAX_WINDOWS if LONG_TEXT_MODE else 0,
+                            window_overlap=LONG_TEXT_WINDOW_OVERLAP,
+                            return_embeddings=embedding_store is not None)
+    if embedding_store is None:
+        return results
+    
+    results, embeddings = results
+    records = records or [{}] * len(query_texts)
+    try:
+        started = time.perf_counter()
+        embedding_store.append(
+            embeddings,
+            query_texts,
+            [record.get('user') for record in records],
+            [splunk_time_to_epoch(record.get('_time')) for record in records],
+            [result['most_similar_term'] for result in results]
+        )
+        add_timing(request_timings(), 'embedding_store', started)
+    except Exception as e:
+        print(f"Error appending to embedding store: {e}")
+    return results
 
 # --------------------------
 # 7️⃣ Splunk REST API Configuration
@@ -216,6 +259,13 @@ SPLUNK_USERNAME = os.getenv('SPLUNK_USERNAME', 'admin')
 SPLUNK_PASSWORD = os.getenv('SPLUNK_PASSWORD', 'your-password-here')
 SPLUNK_SEARCH_NAME = os.getenv('SPLUNK_SEARCH_NAME', 'nlp_docker_test')
 
+# Time-partitioned pulls: split the last SPLUNK_PULL_LOOKBACK_SECONDS into
+# SPLUNK_PARTITIONS sub-windows dispatched as concurrent jobs (1 = single job
+# using the saved search's own time range)
+SPLUNK_PARTITIONS = int(os.getenv('SPLUNK_PARTITIONS', '1'))
+SPLUNK_PARTITION_CONCURRENCY = int(os.getenv('SPLUNK_PARTITION_CONCURRENCY', '4'))
+SPLUNK_PULL_LOOKBACK_SECONDS = int(os.getenv('SPLUNK_PULL_LOOKBACK_SECONDS', '900'))
+
 # --------------------------
 # 8️⃣ HEC (HTTP Event Collector) Configuration
 # --------------------------
@@ -223,9 +273,19 @@ HEC_URL = os.getenv('SPLUNK_HEC_URL', 'https://your-splunk-instance:8088/service
 HEC_TOKEN = os.getenv('SPLUNK_HEC_TOKEN', 'your-hec-token-here')
 HEC_INDEX = os.getenv('SPLUNK_INDEX', 'nlp_alerts')
 
-def run_splunk_search():
+# Pre-aggregated per-minute metrics sent to a Splunk metrics index
+HEC_METRICS_ENABLED = os.getenv('HEC_METRICS_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+HEC_METRICS_INDEX = os.getenv('SPLUNK_METRICS_INDEX', 'nlp_metrics')
+METRICS_MAX_BACKLOG_SECONDS = 3600
+
+metrics_rollup = MetricsRollup()
+
+@timed_stage('splunk_dispatch')
+def run_splunk_search(earliest_time=None, latest_time=None):
     """
-    Trigger a saved search in Splunk and return the job SID
+    Trigger a saved search in Splunk and return the job SID.
+    earliest_time/latest_time (epoch seconds or Splunk time modifiers)
+    override the saved search's time range.
     """
     try:
         url = f"{SPLUNK_REST_URL}/services/saved/searches/{SPLUNK_SEARCH_NAME}/dispatch"
@@ -236,7 +296,13 @@ def run_splunk_search():
         # Use Basic Authentication
         auth = (SPLUNK_USERNAME, SPLUNK_PASSWORD)
         
-        response = requests.post(url, headers=headers, auth=auth, verify=False, timeout=30)
+        data = {}
+        if earliest_time is not None:
+            data['dispatch.earliest_time'] = earliest_time
+        if latest_time is not None:
+            data['dispatch.latest_time'] = latest_time
+        
+        response = requests.post(url, headers=headers, data=data, auth=auth, verify=False, timeout=30)
         response.raise_for_status()
         
         # Extract SID from response
@@ -248,95 +314,111 @@ def run_splunk_search():
         print(f"Error starting Splunk search: {e}")
         return None
 
-def get_splunk_results(sid, max_wait=120, batch_size=1000):
+def wait_for_splunk_job(sid, max_wait=120, keep_waiting=None):
     """
-    Retrieve search results from Splunk by SID with batch processing
+    Poll a search job until it is done.
+    keep_waiting(), if given, is called before every poll; returning False
+    stops waiting (e.g. when a lease on the job could not be renewed).
+    Returns the job's status content (isDone, resultCount, ...) or None on
+    timeout or when told to stop.
     """
-    try:
-        # First, check if job is complete
-        status_url = f"{SPLUNK_REST_URL}/services/search/jobs/{sid}"
-        headers = {
-            'Content-Type': 'application/json'
-        }
-        
-        # Add JSON output mode parameter
-        status_params = {'output_mode': 'json'}
+    status_url = f"{SPLUNK_REST_URL}/services/search/jobs/{sid}"
+    headers = {
+        'Content-Type': 'application/json'
+    }
+    
+    # Add JSON output mode parameter
+    status_params = {'output_mode': 'json'}
+    
+    # Use Basic Authentication
+    auth = (SPLUNK_USERNAME, SPLUNK_PASSWORD)
+    
+    # Wait for job to complete
+    for attempt in range(max_wait):
+        if keep_waiting is not None and not keep_waiting():
+            print("Stopped waiting for search job")
+            return None
         
-        # Use Basic Authentication
-        auth = (SPLUNK_USERNAME, SPLUNK_PASSWORD)
+        status_response = requests.get(status_url, headers=headers, params=status_params, auth=auth, verify=False, timeout=30)
         
-        # Wait for job to complete
-        for attempt in range(max_wait):
-            status_response = requests.get(status_url, headers=headers, params=status_params, auth=auth, verify=False, timeout=30)
-            
-            if status_response.status_code == 200:
-                try:
-                    status_data = status_response.json()
-                    is_done = status_data.get('entry', [{}])[0].get('content', {}).get('isDone', False)
-                    print(f"Job status check {attempt + 1}: isDone={is_done}")
-                    
-                    if is_done:
-                        print("Search job completed, retrieving results...")
-                        break
-                    else:
-                        print(f"Waiting for search to complete... (attempt {attempt + 1}/{max_wait})")
-                        time.sleep(2)
-                except Exception as e:
-                    print(f"Error parsing status response: {e}")
-                    print(f"Status response: {status_response.text[:200]}...")
+        if status_response.status_code == 200:
+            try:
+                status_data = status_response.json()
+                content = status_data.get('entry', [{}])[0].get('content', {})
+                is_done = content.get('isDone', False)
+                print(f"Job status check {attempt + 1}: isDone={is_done}")
+                
+                if is_done:
+                    print("Search job completed, retrieving results...")
+                    return content
+                else:
+                    print(f"Waiting for search to complete... (attempt {attempt + 1}/{max_wait})")
                     time.sleep(2)
-            else:
-                print(f"Error checking job status: {status_response.status_code}")
+            except Exception as e:
+                print(f"Error parsing status response: {e}")
                 print(f"Status response: {status_response.text[:200]}...")
                 time.sleep(2)
         else:
-            print("Search did not complete in time")
-            return None
+            print(f"Error checking job status: {status_response.status_code}")
+            print(f"Status response: {status_response.text[:200]}...")
+            time.sleep(2)
+    
+    print("Search did not complete in time")
+    return None
+
+def fetch_splunk_results_page(sid, offset, count):
+    """
+    Retrieve one page of results from a finished search job.
+    Returns the list of results, or None on error.
+    """
+    try:
+        results_url = f"{SPLUNK_REST_URL}/services/search/jobs/{sid}/results"
+        headers = {
+            'Content-Type': 'application/json'
+        }
+        batch_params = {
+            'output_mode': 'json',
+            'count': count,
+            'offset': offset
+        }
+        auth = (SPLUNK_USERNAME, SPLUNK_PASSWORD)
         
-        # Get total count first
-        count_url = f"{SPLUNK_REST_URL}/services/search/jobs/{sid}/results"
-        count_params = {'output_mode': 'json', 'count': 0}
-        count_response = requests.get(count_url, headers=headers, params=count_params, auth=auth, verify=False, timeout=30)
+        batch_response = requests.get(results_url, headers=headers, params=batch_params, auth=auth, verify=False, timeout=60)
         
-        if count_response.status_code != 200:
-            print(f"Error getting result count: {count_response.status_code}")
-            print(f"Response: {count_response.text}")
+        if batch_response.status_code != 200:
+            print(f"Error retrieving batch at offset {offset}: {batch_response.status_code}")
             return None
+        return batch_response.json().get('results', [])
         
-        try:
-            count_data = count_response.json()
-            total_results = len(count_data.get('results', []))
-            print(f"Total results available: {total_results}")
-            print(f"Response keys: {list(count_data.keys())}")
-        except Exception as e:
-            print(f"Error parsing count response: {e}")
-            print(f"Response status: {count_response.status_code}")
-            print(f"Response headers: {dict(count_response.headers)}")
-            print(f"Response text: {count_response.text[:500]}...")
+    except Exception as e:
+        print(f"Error retrieving batch at offset {offset}: {e}")
+        return None
+
+@timed_stage('splunk_results')
+def get_splunk_results(sid, max_wait=120, batch_size=1000):
+    """
+    Retrieve search results from Splunk by SID with batch processing
+    """
+    try:
+        # First, check if job is complete; the finished job reports its result count
+        job = wait_for_splunk_job(sid, max_wait)
+        if job is None:
             return None
         
+        total_results = int(job.get('resultCount', 0))
+        print(f"Total results available: {total_results}")
+        
         # Process in batches
         all_results = []
         offset = 0
         
         while offset < total_results:
-            batch_params = {
-                'output_mode': 'json',
-                'count': batch_size,
-                'offset': offset
-            }
-            
-            batch_response = requests.get(count_url, headers=headers, params=batch_params, auth=auth, verify=False, timeout=60)
-            
-            if batch_response.status_code == 200:
-                batch_data = batch_response.json()
-                batch_results = batch_data.get('results', [])
-                all_results.extend(batch_results)
-                print(f"Retrieved batch {offset//batch_size + 1}: {len(batch_results)} results (Total: {len(all_results)})")
-                offset += batch_size
-            else:
-                print(f"Error retrieving batch at offset {offset}: {batch_response.status_code}")
+            batch_results = fetch_splunk_results_page(sid, offset, batch_size)
+            if batch_results is None:
                 break
+            all_results.extend(batch_results)
+            print(f"Retrieved batch {offset//batch_size + 1}: {len(batch_results)} results (Total: {len(all_results)})")
+            offset += batch_size
         
         print(f"Retrieved {len(all_results)} total results from Splunk")
         return all_results
@@ -345,6 +427,104 @@ def get_splunk_results(sid, max_wait=120, batch_size=1000):
         print(f"Error retrieving Splunk results: {e}")
         return None
 
+def run_partition(index, earliest_time, latest_time):
+    """
+    Dispatch and collect one time partition. Returns (results, timing) where
+    results is None if the partition failed.
+    """
+    timing = {
+        "partition": index,
+        "earliest": datetime.fromtimestamp(earliest_time).isoformat(),
+        "latest": datetime.fromtimestamp(latest_time).isoformat()
+    }
+    started = time.perf_counter()
+    sid = run_splunk_search(earliest_time, latest_time)
+    timing['sid'] = sid
+    timing['dispatch_seconds'] = round(time.perf_counter() - started, 3)
+    if not sid:
+        return None, timing
+    
+    started = time.perf_counter()
+    results = get_splunk_results(sid)
+    timing['search_and_fetch_seconds'] = round(time.perf_counter() - started, 3)
+    timing['results'] = len(results) if results is not None else None
+    return results, timing
+
+def get_partitioned_splunk_results(partitions=None, concurrency=None, lookback_seconds=None, on_results=None):
+    """
+    Split the pull's time range into equal sub-windows and run them as
+    concurrent search jobs (at most `concurrency` at once). Windows are
+    collected as they finish; on_results(results), if given, is called with
+    each window's results (oldest first) right away, so finished windows are
+    analyzed while the other searches are still running.
+    Returns (window_outputs, partition_timings). window_outputs has one entry
+    per successful window, in partition (time) order: what on_results
+    returned for it, or its results without a callback. It is None if every
+    window failed. Failed windows are marked "failed" in partition_timings.
+    """
+    partitions = partitions or SPLUNK_PARTITIONS
+    concurrency = concurrency or SPLUNK_PARTITION_CONCURRENCY
+    lookback_seconds = lookback_seconds or SPLUNK_PULL_LOOKBACK_SECONDS
+    
+    latest = int(time.time()) // 60 * 60
+    earliest = latest - lookback_seconds
+    bounds = [earliest + (latest - earliest) * i // partitions for i in range(partitions + 1)]
+    
+    started = time.perf_counter()
+    window_outputs = {}
+    partition_timings = []
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='splunk-partition') as executor:
+        futures = [
+            executor.submit(run_partition, i, bounds[i], bounds[i + 1])
+            for i in range(partitions)
+        ]
+        for future in as_completed(futures):
+            results, timing = future.result()
+            partition_timings.append(timing)
+            print(f"[PARTITION] {timing['partition'] + 1}/{partitions} {timing['earliest']} - {timing['latest']}: "
+                  f"{timing.get('results')} results, dispatch {timing['dispatch_seconds']}s, "
+                  f"search+fetch {timing.get('search_and_fetch_seconds')}s")
+            if results is None:
+                timing['failed'] = True
+                continue
+            
+            # Sort each window by _time (oldest first)
+            results = sorted(results, key=lambda result: result.get('_time', ''))
+            window_outputs[timing['partition']] = on_results(results) if on_results is not None else results
+    
+    partition_timings.sort(key=lambda timing: timing['partition'])
+    failed_count = partitions - len(window_outputs)
+    print(f"[PARTITION] {partitions} windows finished in {time.perf_counter() - started:.1f}s"
+          + (f", {failed_count} failed" if failed_count else ""))
+    if not window_outputs:
+        return None, partition_timings
+    
+    # Windows are disjoint and ordered, so partition order is time order
+    return [window_outputs[i] for i in sorted(window_outputs)], partition_timings
+
+def pull_splunk_results(on_results=None):
+    """
+    Run the configured saved search - as one job, or as concurrent time
+    partitions when SPLUNK_PARTITIONS > 1. on_results(results), if given, is
+    called for each retrieved batch: once per partition as it finishes, or
+    once with all results of a single job.
+    Returns (batch_outputs, partition_timings): one entry per batch in time
+    order, holding on_results' return value (or the batch's results).
+    batch_outputs is None on failure.
+    """
+    if SPLUNK_PARTITIONS > 1:
+        return get_partitioned_splunk_results(on_results=on_results)
+    
+    sid = run_splunk_search()
+    if not sid:
+        print("Failed to start Splunk search")
+        return None, []
+    results = get_splunk_results(sid)
+    if not results:
+        return None, []
+    return [on_results(results) if on_results is not None else results], []
+
+@timed_stage('splunk_send')
 def send_to_splunk(event_data, source_type="nlp_analysis", original_time_str=None):
     """
     Send analysis results back to Splunk via HEC
@@ -393,6 +573,14 @@ def send_to_splunk(event_data, source_type="nlp_analysis", original_time_str=Non
         
         if response.status_code == 200:
             print(f"Successfully sent event to Splunk: {event_data.get('query', 'unknown')}")
+            # Rollups only count events HEC accepted, so they match the nlp_alerts index
+            if HEC_METRICS_ENABLED:
+                metrics_rollup.record(
+                    event_data.get('similarity_score', 0.0),
+                    event_data.get('most_similar_term', 'none'),
+                    source_type,
+                    event_data.get('processing_latency_seconds')
+                )
             return True
         else:
             print(f"Failed to send to Splunk: {response.status_code} - {response.text}")
@@ -402,72 +590,351 @@ def send_to_splunk(event_data, source_type="nlp_analysis", original_time_str=Non
         print(f"Error sending to Splunk: {e}")
         return False
 
+def flush_metrics(include_current=False):
+    """
+    Send closed per-minute rollups to HEC as metric events. Rollups that fail
+    to send are kept (up to METRICS_MAX_BACKLOG_SECONDS old) for the next flush.
+    """
+    rollups = metrics_rollup.drain(include_current=include_current)
+    if not rollups:
+        return True
+    
+    events = []
+    for rollup in rollups:
+        events.extend(rollup.to_hec_events(HEC_METRICS_INDEX, "nlp_alert_service"))
+    
+    try:
+        headers = {
+            'Authorization': f'Splunk {HEC_TOKEN}',
+            'Content-Type': 'application/json'
+        }
+        # HEC accepts several events concatenated in one request body
+        payload = '\n'.join(json.dumps(event) for event in events)
+        response = requests.post(HEC_URL, headers=headers, data=payload, verify=False, timeout=10)
+        
+        if response.status_code == 200:
+            print(f"Sent {len(events)} metric events for {len(rollups)} minute(s) to {HEC_METRICS_INDEX}")
+            return True
+        print(f"Failed to send metrics to Splunk: {response.status_code} - {response.text}")
+    except Exception as e:
+        print(f"Error sending metrics to Splunk: {e}")
+    
+    cutoff = time.time() - METRICS_MAX_BACKLOG_SECONDS
+    metrics_rollup.restore([rollup for rollup in rollups if rollup.minute >= cutoff])
+    return False
+
 # --------------------------
 # 9️⃣ Scheduled Background Job
 # --------------------------
+def process_scheduled_results(results, before_send=None):
+    """
+    Analyze a list of Splunk results in one batch and send each analysis to HEC.
+    before_send(position), if given, is called with a result's position in
+    `results` before it is sent; returning False stops processing there.
+    Returns the number of results processed.
+    """
+    # Analyze all queries in one batch, then process each result
+    positions = [position for position, result in enumerate(results) if result.get('SearchQueryText', '')]
+    results = [results[position] for position in positions]
+    analyses = analyze_queries([result['SearchQueryText'] for result in results], records=results)
+    
+    processed_count = 0
+    for position, result, analysis in zip(positions, results, analyses):
+        if before_send is not None and not before_send(position):
+            break
+        
+        # Add original Splunk data
+        analysis['splunk_data'] = result
+        analysis['timestamp'] = datetime.now().isoformat()
+        analysis['source'] = 'scheduled_pull'
+        
+        # Preserve original _time field for HEC
+        original_time = result.get('_time', '')
+        if original_time:
+            analysis['original_time'] = convert_splunk_iso_to_simple(original_time)
+        
+        # Send to Splunk HEC with original time
+        send_to_splunk(analysis, "splunk_rest_analysis", original_time)
+        processed_count += 1
+    return processed_count
+
 def scheduled_splunk_pull():
     """
     Background job that runs every 15 minutes to pull Splunk data
     """
     print(f"[SCHEDULED] Starting automated Splunk pull at {datetime.now()}")
     
+    if not resources_ready.is_set():
+        print("[SCHEDULED] Model not loaded yet, skipping this run")
+        return
+    
+    if coordinator is not None:
+        coordinated_splunk_pull()
+        return
+    
     try:
-        # 1. Trigger the saved search
-        sid = run_splunk_search()
-        if not sid:
-            print("[SCHEDULED] Failed to start Splunk search")
-            return
-        
-        # 2. Get all results
-        results = get_splunk_results(sid)
-        if not results:
+        # 1. Trigger the saved search; each partition is analyzed and sent as it arrives
+        processed_counts, _ = pull_splunk_results(on_results=process_scheduled_results)
+        if processed_counts is None:
             print("[SCHEDULED] Failed to retrieve search results")
             return
         
-        # 3. Process each result
+        print(f"[SCHEDULED] Completed: Processed {sum(processed_counts)} search results")
+        
+    except Exception as e:
+        print(f"[SCHEDULED] Error during automated pull: {e}")
+
+# --------------------------
+# 9️⃣ Multi-replica coordination of scheduled pulls
+# --------------------------
+# With COORDINATION_BACKEND set, one replica per interval dispatches the saved
+# search and publishes its result offsets as shards; every replica claims and
+# processes shards. Shards held by dead replicas are re-claimed after
+# SHARD_LEASE_SECONDS and resume from their last recorded offset. A shard is
+# marked failed after SHARD_MAX_ATTEMPTS claims (e.g. the search job expired).
+COORDINATION_BACKEND = os.getenv('COORDINATION_BACKEND', '')
+REPLICA_ID = os.getenv('REPLICA_ID', f"{socket.gethostname()}-{os.getpid()}")
+SHARD_SIZE = int(os.getenv('SHARD_SIZE', '1000'))
+SHARD_PAGE_SIZE = int(os.getenv('SHARD_PAGE_SIZE', '200'))
+SHARD_LEASE_SECONDS = int(os.getenv('SHARD_LEASE_SECONDS', '120'))
+SHARD_MAX_ATTEMPTS = int(os.getenv('SHARD_MAX_ATTEMPTS', '3'))
+DISPATCH_LEASE_SECONDS = int(os.getenv('DISPATCH_LEASE_SECONDS', '300'))
+COORDINATION_MAX_WAIT_SECONDS = int(os.getenv('COORDINATION_MAX_WAIT_SECONDS', '600'))
+COORDINATION_POLL_SECONDS = 5
+SHARD_MAX_AGE_SECONDS = 3600
+# The shard lease is renewed before any HEC send that could start with less
+# than this left on it; must exceed one send (HEC timeout is 10 seconds)
+SHARD_LEASE_MARGIN_SECONDS = 30
+
+coordinator = create_coordinator(COORDINATION_BACKEND)
+
+def current_interval_id():
+    """Identify the 15-minute schedule slot this run belongs to"""
+    now = datetime.now()
+    return now.replace(minute=now.minute - now.minute % 15, second=0, microsecond=0).strftime("%Y-%m-%dT%H:%M")
+
+def dispatch_interval(interval_id):
+    """
+    Dispatch the saved search for this interval and publish its result
+    offsets as shards. Called only by the replica holding the dispatch lease,
+    which is renewed on every poll while the job runs.
+    Returns True once the interval is published (by this or another replica).
+    """
+    lease_name = f"dispatch:{interval_id}"
+    sid = run_splunk_search()
+    if not sid:
+        print("[COORDINATION] Failed to start Splunk search")
+        return False
+    
+    job = wait_for_splunk_job(
+        sid, keep_waiting=lambda: coordinator.acquire_lease(lease_name, REPLICA_ID, DISPATCH_LEASE_SECONDS)
+    )
+    if job is None:
+        print(f"[COORDINATION] Search job {sid} did not complete or the dispatch lease was lost")
+        return coordinator.get_interval(interval_id) is not None
+    
+    total = int(job.get('resultCount', 0))
+    if not coordinator.publish_interval(interval_id, sid, total, SHARD_SIZE, REPLICA_ID):
+        published = coordinator.get_interval(interval_id)
+        print(f"[COORDINATION] {interval_id} was already published by {published['dispatcher']} "
+              f"(sid={published['sid']}), discarding job {sid}")
+        return True
+    print(f"[COORDINATION] {REPLICA_ID} dispatched {interval_id}: sid={sid}, {total} results, "
+          f"{-(-total // SHARD_SIZE)} shards")
+    return True
+
+def process_shard(shard):
+    """
+    Process a claimed shard page by page. The lease is renewed with the
+    current offset before each page, and again with the offset of the next
+    unsent result whenever a send could otherwise outlast it - so results are
+    only sent while this replica holds the shard, and a re-claimed shard
+    resumes where it stopped.
+    Returns the number of results processed.
+    """
+    interval_id, shard_id = shard['interval_id'], shard['shard_id']
+    offset = shard['next_offset']
+    processed_count = 0
+    lease = {'expires': 0.0, 'lost': False}
+    
+    def hold_lease(next_offset, force=False):
+        """Renew the lease unless more than SHARD_LEASE_MARGIN_SECONDS are left. False if lost."""
+        if not force and time.monotonic() < lease['expires'] - SHARD_LEASE_MARGIN_SECONDS:
+            return True
+        renewed_at = time.monotonic()
+        if not coordinator.update_shard_progress(interval_id, shard_id, REPLICA_ID, next_offset, SHARD_LEASE_SECONDS):
+            print(f"[COORDINATION] Lost lease on shard {interval_id}/{shard_id} at offset {next_offset}, stopping")
+            lease['lost'] = True
+            return False
+        lease['expires'] = renewed_at + SHARD_LEASE_SECONDS
+        return True
+    
+    if shard['previous_owner']:
+        print(f"[COORDINATION] Took over shard {interval_id}/{shard_id} from {shard['previous_owner']} "
+              f"at offset {offset} (attempt {shard['attempts']})")
+    
+    while offset < shard['end_offset']:
+        if not hold_lease(offset, force=True):
+            return processed_count
+        
+        count = min(SHARD_PAGE_SIZE, shard['end_offset'] - offset)
+        results = fetch_splunk_results_page(shard['sid'], offset, count)
+        if results is None:
+            status = coordinator.fail_shard(interval_id, shard_id, REPLICA_ID, offset, SHARD_MAX_ATTEMPTS)
+            print(f"[COORDINATION] Could not fetch shard {interval_id}/{shard_id} at offset {offset}, "
+                  f"shard is now {status or 'owned by another replica'}")
+            return processed_count
+        
+        page_offset = offset
+        processed_count += process_scheduled_results(
+            results, before_send=lambda position: hold_lease(page_offset + position)
+        )
+        if lease['lost']:
+            return processed_count
+        offset += count
+    
+    coordinator.complete_shard(interval_id, shard_id, REPLICA_ID, offset)
+    return processed_count
+
+def coordinated_splunk_pull():
+    """
+    Scheduled pull in multi-replica mode: elect a dispatcher for this interval,
+    then claim and process shards until none are left open.
+    """
+    interval_id = current_interval_id()
+    started = time.time()
+    deadline = started + COORDINATION_MAX_WAIT_SECONDS
+    
+    try:
+        # 1. Elect one dispatcher; the others wait for the shards to be published
+        while coordinator.get_interval(interval_id) is None and time.time() < deadline:
+            if coordinator.acquire_lease(f"dispatch:{interval_id}", REPLICA_ID, DISPATCH_LEASE_SECONDS):
+                if not dispatch_interval(interval_id):
+                    coordinator.release_lease(f"dispatch:{interval_id}", REPLICA_ID)
+                    return
+                break
+            time.sleep(COORDINATION_POLL_SECONDS)
+        
+        # 2. Claim shards (including expired ones from dead replicas) until all are done
+        since = started - SHARD_MAX_AGE_SECONDS
         processed_count = 0
-        for result in results:
-            query_text = result.get('SearchQueryText', '')
-            if not query_text:
+        shards_processed = 0
+        while time.time() < deadline:
+            shard = coordinator.claim_shard(REPLICA_ID, SHARD_LEASE_SECONDS, since, SHARD_MAX_ATTEMPTS)
+            if shard is not None:
+                processed_count += process_shard(shard)
+                shards_processed += 1
                 continue
-                
-            # Analyze the query
-            analysis = analyze_query(query_text)
-            
-            # Add original Splunk data
-            analysis['splunk_data'] = result
-            analysis['timestamp'] = datetime.now().isoformat()
-            analysis['source'] = 'scheduled_pull'
-            
-            # Preserve original _time field for HEC
-            original_time = result.get('_time', '')
-            if original_time:
-                analysis['original_time'] = convert_splunk_iso_to_simple(original_time)
-            
-            # Send to Splunk HEC with original time
-            send_to_splunk(analysis, "splunk_rest_analysis", original_time)
-            processed_count += 1
+            if coordinator.count_open_shards(since) == 0:
+                break
+            time.sleep(COORDINATION_POLL_SECONDS)
         
-        print(f"[SCHEDULED] Completed: Processed {processed_count} search results")
+        print(f"[COORDINATION] {REPLICA_ID} completed {interval_id}: "
+              f"{shards_processed} shards, {processed_count} search results")
         
     except Exception as e:
-        print(f"[SCHEDULED] Error during automated pull: {e}")
+        print(f"[COORDINATION] Error during coordinated pull: {e}")
+
+def compact_embedding_store():
+    """
+    Hourly job: apply retention and merge small sealed embedding store segments
+    """
+    if embedding_store is None:
+        return
+    try:
+        print(f"[COMPACTION] Embedding store: {embedding_store.compact()} -> {embedding_store.stats()}")
+    except Exception as e:
+        print(f"[COMPACTION] Error compacting embedding store: {e}")
+
+def close_embedding_store():
+    """Flush the embedding store manifest at exit"""
+    if embedding_store is not None:
+        embedding_store.close()
 
 # --------------------------
 # 🔟 Initialize Flask app
 # --------------------------
 app = Flask(__name__)
 
+def is_operational_path(path):
+    """Health, admin and status endpoints - not analysis traffic"""
+    return path.startswith(('/health', '/admin')) or path in ('/scheduler_status', '/coordination_status')
+
+@app.before_request
+def require_admin_token():
+    """/admin endpoints are disabled unless NLP_ADMIN_TOKEN is set, and then require it"""
+    if not request.path.startswith('/admin'):
+        return None
+    if not ADMIN_TOKEN:
+        return jsonify({"error": "Admin endpoints are disabled (set NLP_ADMIN_TOKEN to enable)"}), 403
+    if not hmac.compare_digest(request.headers.get('X-Admin-Token', ''), ADMIN_TOKEN):
+        return jsonify({"error": "Invalid or missing X-Admin-Token"}), 403
+    return None
+
+@app.before_request
+def reject_until_ready():
+    """Return 503 for analysis endpoints until the model has been loaded"""
+    if is_operational_path(request.path):
+        return None
+    if not resources_ready.is_set():
+        return jsonify({"error": "Service is warming up, model not loaded yet"}), 503
+    return None
+
+@app.before_request
+def start_request_timing():
+    """Enable the per-stage timing breakdown when the client asks for it"""
+    if request.headers.get('X-Debug-Timing') == '1' or request.args.get('debug_timing') == '1':
+        g.timings = {}
+        g.request_started = time.perf_counter()
+
+@app.after_request
+def finish_request_timing(response):
+    """Count requests for an active profile and attach timings if requested"""
+    if active_profile is not None and not is_operational_path(request.path):
+        record_profiled_request()
+    
+    timings = g.get('timings')
+    if timings is None:
+        return response
+    
+    add_timing(timings, 'total', g.request_started)
+    timings_ms = {stage: round(seconds * 1000, 3) for stage, seconds in timings.items()}
+    response.headers['Server-Timing'] = ', '.join(f"{stage};dur={ms}" for stage, ms in timings_ms.items())
+    
+    body = response.get_json(silent=True) if response.is_json else None
+    if isinstance(body, dict):
+        body['timings_ms'] = timings_ms
+        response.set_data(json.dumps(body))
+    return response
+
 @app.route('/health', methods=['GET'])
 def health_check():
     """Health check endpoint"""
     return jsonify({"status": "healthy", "message": "NLP Alert Service is running"})
 
+@app.route('/health/live', methods=['GET'])
+def liveness_check():
+    """Liveness probe - the process is up and serving HTTP"""
+    return jsonify({"status": "alive"})
+
+@app.route('/health/ready', methods=['GET'])
+def readiness_check():
+    """Readiness probe - the model and term index are loaded and scoring works"""
+    if resources_ready.is_set():
+        return jsonify({"status": "ready", "startup_timings": startup_timings})
+
+    status = "failed" if startup_error else "warming_up"
+    return jsonify({
+        "status": status,
+        "error": startup_error,
+        "startup_timings": startup_timings
+    }), 503
+
 @app.route('/analyze', methods=['POST'])
 def analyze_alert():
     """
     Analyze a single query/alert text.
-    Expects JSON with 'query' field.
+    Expects JSON with 'query' field and an optional 'term_sets' list of set names.
     """
     try:
         data = request.get_json()
@@ -475,7 +942,7 @@ def analyze_alert():
             return jsonify({"error": "Missing 'query' field in request"}), 400
         
         query_text = data['query']
-        result = analyze_query(query_text)
+        result = analyze_query(query_text, data.get('term_sets'), record=data)
         
         # Add metadata for Splunk
         result['timestamp'] = datetime.now().isoformat()
@@ -487,6 +954,8 @@ def analyze_alert():
         
         return jsonify(result)
     
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -494,7 +963,8 @@ def analyze_alert():
 def analyze_batch():
     """
     Analyze multiple queries/alert texts.
-    Expects JSON with 'queries' field containing array of strings.
+    Expects JSON with 'queries' field containing array of strings and an
+    optional 'term_sets' list of set names.
     """
     try:
         data = request.get_json()
@@ -506,8 +976,7 @@ def analyze_batch():
             return jsonify({"error": "'queries' must be an array"}), 400
         
         results = []
-        for query_text in queries:
-            result = analyze_query(query_text)
+        for result in analyze_queries(queries, data.get('term_sets'), records=[data] * len(queries)):
             # Add metadata for Splunk
             result['timestamp'] = datetime.now().isoformat()
             result['source_ip'] = request.remote_addr
@@ -522,6 +991,8 @@ def analyze_batch():
             "count": len(results)
         })
     
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -537,7 +1008,7 @@ def analyze_detailed():
             return jsonify({"error": "Missing 'query' field in request"}), 400
         
         query_text = data['query']
-        result = analyze_query(query_text)
+        result = analyze_query(query_text, data.get('term_sets'), record=data)
         
         # Add metadata
         result['timestamp'] = datetime.now().isoformat()
@@ -549,6 +1020,8 @@ def analyze_detailed():
         
         return jsonify(result)
     
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -560,46 +1033,44 @@ def process_splunk_search():
     try:
         print("Starting Splunk search...")
         
-        # 1. Trigger the saved search
-        sid = run_splunk_search()
-        if not sid:
-            return jsonify({"error": "Failed to start Splunk search"}), 500
-        
-        # 2. Get all results
-        results = get_splunk_results(sid)
-        if not results:
-            return jsonify({"error": "Failed to retrieve search results"}), 500
-        
-        # 3. Process each result
-        analyzed_results = []
-        for result in results:
-            # Extract search query
-            query_text = result.get('SearchQueryText', '')
-            if not query_text:
-                continue
-                
-            # Analyze the query
-            analysis = analyze_query(query_text)
-            
-            # Add original Splunk data
-            analysis['splunk_data'] = result
-            analysis['timestamp'] = datetime.now().isoformat()
-            analysis['source'] = 'splunk_rest_api'
-            
-            # Preserve original _time field for HEC
-            original_time = result.get('_time', '')
-            if original_time:
-                analysis['original_time'] = convert_splunk_iso_to_simple(original_time)
-            
-            analyzed_results.append(analysis)
+        def process_results(results):
+            # Analyze a batch of queries in one call, then process each result
+            results = [result for result in results if result.get('SearchQueryText', '')]
+            analyses = analyze_queries([result['SearchQueryText'] for result in results], records=results)
             
-            # Send to Splunk HEC with original time
-            send_to_splunk(analysis, "splunk_rest_analysis", original_time)
+            analyzed_results = []
+            for result, analysis in zip(results, analyses):
+                # Add original Splunk data
+                analysis['splunk_data'] = result
+                analysis['timestamp'] = datetime.now().isoformat()
+                analysis['source'] = 'splunk_rest_api'
+                
+                # Preserve original _time field for HEC
+                original_time = result.get('_time', '')
+                if original_time:
+                    analysis['original_time'] = convert_splunk_iso_to_simple(original_time)
+                
+                analyzed_results.append(analysis)
+                
+                # Send to Splunk HEC with original time
+                send_to_splunk(analysis, "splunk_rest_analysis", original_time)
+            return analyzed_results
         
-        return jsonify({
+        # Trigger the saved search (optionally as time partitions); each
+        # partition is analyzed and sent to HEC as soon as it arrives, and the
+        # response lists the analyses in time order
+        window_analyses, partition_timings = pull_splunk_results(on_results=process_results)
+        if window_analyses is None:
+            return jsonify({"error": "Failed to retrieve search results", "partitions": partition_timings}), 500
+        analyzed_results = [analysis for analyses in window_analyses for analysis in analyses]
+        
+        response = {
             "message": f"Processed {len(analyzed_results)} search results",
             "results": analyzed_results
-        })
+        }
+        if partition_timings:
+            response['partitions'] = partition_timings
+        return jsonify(response)
         
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -636,20 +1107,23 @@ def splunk_webhook():
         if not search_results:
             return jsonify({"error": "No search results found"}), 400
         
-        analyzed_results = []
+        # Extract the search query - handle different field names
+        records = []
         for result in search_results:
-            # Extract the search query - handle different field names
             query_text = (result.get('SearchQueryText') or 
                          result.get('search') or 
                          result.get('query') or 
                          result.get('_raw', ''))
             
-            if not query_text:
-                continue
-                
-            # Analyze the query
-            analysis = analyze_query(query_text)
-            
+            if query_text:
+                records.append((result, query_text))
+        
+        # Analyze all queries in one batch
+        analyses = analyze_queries([query_text for _, query_text in records],
+                                   records=[result for result, _ in records])
+        
+        analyzed_results = []
+        for (result, _), analysis in zip(records, analyses):
             # Add original Splunk data
             analysis['splunk_data'] = result
             analysis['timestamp'] = datetime.now().isoformat()
@@ -672,6 +1146,133 @@ def splunk_webhook():
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@app.route('/similar_queries', methods=['POST'])
+def similar_queries():
+    """
+    Find the k past queries most similar to a query.
+    Expects JSON with 'query' and optional 'k' (default 10, max 100),
+    'user', 'earliest' and 'latest' (epoch seconds or ISO time).
+    """
+    if embedding_store is None:
+        return jsonify({"error": "Embedding store is not enabled (set EMBEDDING_STORE_DIR)"}), 404
+    
+    try:
+        data = request.get_json()
+        if not data or 'query' not in data:
+            return jsonify({"error": "Missing 'query' field in request"}), 400
+        
+        try:
+            k = min(max(int(data.get('k', 10)), 1), 100)
+        except (TypeError, ValueError):
+            return jsonify({"error": "'k' must be an integer"}), 400
+        try:
+            earliest = parse_epoch_or_iso(data['earliest']) if data.get('earliest') is not None else None
+            latest = parse_epoch_or_iso(data['latest']) if data.get('latest') is not None else None
+        except ValueError:
+            return jsonify({"error": "'earliest' and 'latest' must be epoch seconds or ISO times"}), 400
+        
+        started = time.perf_counter()
+        # Windowed and pooled like the stored embeddings, so long texts compare like for like
+        query_embedding = embed_texts(embedding_model, [data['query']],
+                                      max_windows=LONG_TEXT_MAX_WINDOWS if LONG_TEXT_MODE else 0,
+                                      window_overlap=LONG_TEXT_WINDOW_OVERLAP)[0]
+        matches = embedding_store.search(query_embedding, k=k, user=data.get('user'),
+                                         earliest=earliest, latest=latest)
+        add_timing(request_timings(), 'similarity_search', started)
+        
+        for match in matches:
+            match['time'] = datetime.fromtimestamp(match['time']).isoformat()
+        
+        return jsonify({
+            "query": data['query'],
+            "count": len(matches),
+            "matches": matches
+        })
+    
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/term_sets', methods=['GET'])
+def list_term_sets():
+    """List the loaded term sets with their size and threshold"""
+    return jsonify({
+        "term_sets": [
+            {"name": term_set.name, "terms": len(term_set.terms), "threshold": term_set.threshold}
+            for term_set in term_sets.values()
+        ]
+    })
+
+# --------------------------
+# On-demand sampling profiler
+# --------------------------
+profile_lock = threading.Lock()
+active_profile = None
+
+def record_profiled_request():
+    """Count a completed request towards the active profile's request target"""
+    with profile_lock:
+        session = active_profile
+        if session is None:
+            return
+        session['requests_seen'] += 1
+        if session['requests_target'] and session['requests_seen'] >= session['requests_target']:
+            session['done'].set()
+
+@app.route('/admin/profile', methods=['POST'])
+def admin_profile():
+    """
+    Run the sampling profiler for N seconds or N requests and return the
+    aggregated collapsed stacks. Expects JSON with 'seconds' or 'requests'
+    (plus optional 'max_seconds' and 'interval_ms'). Use ?format=collapsed
+    for plain collapsed-stack text (flamegraph.pl / speedscope input).
+    Runs are capped at PROFILE_MAX_SECONDS and sample at most every
+    PROFILE_MIN_INTERVAL_MS; health and status probes do not count as requests.
+    """
+    global active_profile
+    
+    data = request.get_json(silent=True) or {}
+    try:
+        seconds = float(data.get('seconds', 0))
+        requests_target = int(data.get('requests', 0))
+        max_seconds = float(data.get('max_seconds', 300))
+        interval = float(data.get('interval_ms', 5)) / 1000
+    except (TypeError, ValueError):
+        return jsonify({"error": "'seconds', 'requests', 'max_seconds' and 'interval_ms' must be numbers"}), 400
+    if seconds <= 0 and requests_target <= 0:
+        return jsonify({"error": "Provide a positive 'seconds' or 'requests'"}), 400
+    if interval <= 0:
+        return jsonify({"error": "'interval_ms' must be positive"}), 400
+    max_seconds = min(max_seconds, PROFILE_MAX_SECONDS) if max_seconds > 0 else PROFILE_MAX_SECONDS
+    interval = max(interval, PROFILE_MIN_INTERVAL_MS / 1000)
+    
+    with profile_lock:
+        if active_profile is not None:
+            return jsonify({"error": "A profile is already running"}), 409
+        session = {
+            "requests_target": requests_target,
+            "requests_seen": 0,
+            "done": threading.Event()
+        }
+        active_profile = session
+    
+    profiler = SamplingProfiler(interval=interval, ignore_thread_ids=[threading.get_ident()])
+    print(f"[PROFILE] Started: seconds={seconds or None}, requests={requests_target or None}")
+    profiler.start()
+    try:
+        session['done'].wait(timeout=min(seconds, max_seconds) if seconds > 0 else max_seconds)
+    finally:
+        profiler.stop()
+        with profile_lock:
+            active_profile = None
+    
+    summary = profiler.summary()
+    summary['requests_profiled'] = session['requests_seen']
+    print(f"[PROFILE] Finished: {summary['samples']} samples, {summary['requests_profiled']} requests")
+    
+    if request.args.get('format') == 'collapsed':
+        return summary['collapsed'], 200, {'Content-Type': 'text/plain; charset=utf-8'}
+    return jsonify(summary)
+
 @app.route('/scheduler_status', methods=['GET'])
 def scheduler_status():
     """Check scheduler status and next run time"""
@@ -686,9 +1287,33 @@ def scheduler_status():
     
     return jsonify({
         "scheduler_running": scheduler.running,
-        "jobs": job_info
+        "jobs": job_info,
+        "replica_id": REPLICA_ID,
+        "coordination_backend": COORDINATION_BACKEND or None
+    })
+
+@app.route('/coordination_status', methods=['GET'])
+def coordination_status():
+    """Shard progress of recent intervals in multi-replica mode"""
+    if coordinator is None:
+        return jsonify({"error": "Coordination is not enabled (set COORDINATION_BACKEND)"}), 404
+    
+    return jsonify({
+        "replica_id": REPLICA_ID,
+        "intervals": coordinator.status(time.time() - SHARD_MAX_AGE_SECONDS)
     })
 
+# --------------------------
+# 🔟 Load model and data (blocking, or in the background for fast start)
+# --------------------------
+if FAST_START:
+    print("Fast start enabled - loading model and data in the background")
+    threading.Thread(target=load_resources, name='warmup', daemon=True).start()
+else:
+    load_resources()
+    if not resources_ready.is_set():
+        raise RuntimeError(f"Failed to load model and data: {startup_error}")
+
 # --------------------------
 # 🔟 Initialize Background Scheduler
 # --------------------------
@@ -701,25 +1326,62 @@ scheduler.add_job(
     id='splunk_pull_job',
     name='Automated Splunk REST API Pull'
 )
+if HEC_METRICS_ENABLED:
+    # Flush closed minutes a few seconds after each minute boundary
+    scheduler.add_job(
+        flush_metrics,
+        'cron',
+        second=5,
+        id='metrics_flush_job',
+        name='Send per-minute metrics rollups to HEC'
+    )
+if EMBEDDING_STORE_DIR:
+    scheduler.add_job(
+        compact_embedding_store,
+        'cron',
+        minute=40,
+        id='embedding_store_compaction_job',
+        name='Embedding store retention and segment compaction'
+    )
 scheduler.start()
 print("✅ Background scheduler started - will run every 15 minutes at :00, :15, :30, :45")
 
-# Ensure scheduler shuts down cleanly when Flask stops
+# Ensure scheduler shuts down cleanly when Flask stops (atexit runs in
+# reverse order, so the embedding store closes after the last job)
+atexit.register(close_embedding_store)
 atexit.register(lambda: scheduler.shutdown())
+if HEC_METRICS_ENABLED:
+    # Registered last so it runs first at exit: send the partial current minute
+    atexit.register(lambda: flush_metrics(include_current=True))
 
 if __name__ == "__main__":
     print("Starting NLP Alert Service...")
     print("Available endpoints:")
     print("  GET  /health - Health check")
+    print("  GET  /health/live - Liveness probe")
+    print("  GET  /health/ready - Readiness probe (503 until model is loaded)")
     print("  POST /analyze - Analyze single query")
     print("  POST /analyze_batch - Analyze multiple queries")
     print("  POST /analyze_detailed - Analyze with multiple term detection")
     print("  POST /process_splunk_search - Pull all results from Splunk REST API (manual)")
     print("  POST /splunk_webhook - Splunk webhook for alerts")
+    print("  POST /similar_queries - Find similar past queries (embedding store)")
+    print("  GET  /term_sets - List loaded term sets")
+    print("  POST /admin/profile - Sampling profile for N seconds or N requests")
     print("  GET  /scheduler_status - Check scheduler status and next run time")
+    print("  GET  /coordination_status - Shard progress in multi-replica mode")
     print(f"HEC URL: {HEC_URL}")
     print(f"HEC Index: {HEC_INDEX}")
+    print(f"HEC Metrics: {HEC_METRICS_INDEX if HEC_METRICS_ENABLED else 'disabled'}")
     print(f"Splunk REST URL: {SPLUNK_REST_URL}")
     print(f"Splunk Username: {SPLUNK_USERNAME}")
     print(f"Splunk Search Name: {SPLUNK_SEARCH_NAME}")
+    if SPLUNK_PARTITIONS > 1:
+        print(f"Splunk Partitions: {SPLUNK_PARTITIONS} x {SPLUNK_PULL_LOOKBACK_SECONDS // SPLUNK_PARTITIONS}s "
+              f"(max {SPLUNK_PARTITION_CONCURRENCY} concurrent)")
+    print(f"Fast Start: {FAST_START}")
+    print(f"Embedding Store: {EMBEDDING_STORE_DIR or 'disabled'}")
+    print(f"Long Text Mode: {f'up to {LONG_TEXT_MAX_WINDOWS} windows' if LONG_TEXT_MODE else 'disabled'}")
+    print(f"Coordination: {COORDINATION_BACKEND or 'disabled (single replica)'} as {REPLICA_ID}")
+    print(f"Term Sets Config: {TERM_SETS_CONFIG or 'default (Suspect_Words.csv)'}")
     app.run(host='0.0.0.0', port=5000, debug=False)
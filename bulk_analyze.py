@@ -0,0 +1,275 @@
+# bulk_analyze.py
+"""
+Offline bulk analysis of exported search logs (CSV or NDJSON).
+
+Streams the input in chunks, fans the chunks out to a process pool (each
+worker loads the model once) and writes results incrementally. Progress is
+checkpointed as a byte offset into the input so an interrupted run can be
+resumed with --resume.
+
+Examples:
+    python bulk_analyze.py export.csv results.ndjson --workers 4
+    python bulk_analyze.py export.ndjson results.csv --field SearchQueryText
+    python bulk_analyze.py export.csv results.ndjson --resume
+"""
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import time
+from collections import deque
+
+from nlp_scoring import (
+    EMBEDDING_MODEL_PATH, DEFAULT_TERMS_PATH, DEFAULT_TERM_SET_NAME, DEFAULT_THRESHOLD, DEFAULT_WINDOW_OVERLAP,
+    load_embedding_model, load_term_set, load_term_sets, select_term_sets, analyze_texts
+)
+
+RESULT_FIELDS = ['most_similar_term', 'similarity_score', 'all_detected_terms', 'term_sets']
+
+# --------------------------
+# Worker process state (loaded once per worker by _init_worker)
+# --------------------------
+_worker_model = None
+_worker_term_sets = []
+_worker_max_windows = 0
+_worker_window_overlap = DEFAULT_WINDOW_OVERLAP
+
+def _init_worker(model_path, terms_path, threshold, term_sets_config, term_set_names, threads_per_worker,
+                 max_windows, window_overlap):
+    """
+    Pool initializer: load the model and the term sets once per worker.
+    """
+    global _worker_model, _worker_term_sets, _worker_max_windows, _worker_window_overlap
+
+    import torch
+    torch.set_num_threads(threads_per_worker)
+
+    _worker_model = load_embedding_model(model_path)
+    if term_sets_config:
+        term_sets = load_term_sets(_worker_model, term_sets_config)
+    else:
+        term_set = load_term_set(_worker_model, DEFAULT_TERM_SET_NAME, terms_path, threshold)
+        term_sets = {term_set.name: term_set}
+    _worker_term_sets = select_term_sets(term_sets, term_set_names)
+    _worker_max_windows = max_windows
+    _worker_window_overlap = window_overlap
+    print(f"[WORKER {os.getpid()}] Ready with term sets: {[term_set.name for term_set in _worker_term_sets]}")
+
+def _analyze_chunk(texts):
+    """
+    Score one chunk of texts in the worker with the service's batched scoring.
+    """
+    return analyze_texts(_worker_model, texts, _worker_term_sets,
+                         max_windows=_worker_max_windows, window_overlap=_worker_window_overlap)
+
+# --------------------------
+# Streaming input
+# --------------------------
+def _read_lines(f, position):
+    """
+    Yield decoded lines from a binary file, recording the byte offset after
+    each line in position['offset'].
+    """
+    while True:
+        line = f.readline()
+        if not line:
+            return
+        position['offset'] = f.tell()
+        yield line.decode('utf-8-sig')
+
+def iter_chunks(input_path, input_format, chunk_size, start_offset=0):
+    """
+    Stream records from the input file in chunks.
+    Yields (records, end_offset) where end_offset is the byte offset just
+    after the last record of the chunk - the resume point once it is written.
+    """
+    position = {'offset': 0}
+    with open(input_path, 'rb') as f:
+        lines = _read_lines(f, position)
+
+        if input_format == 'csv':
+            reader = csv.reader(lines)
+            header = next(reader, None)
+            if header is None:
+                return
+            if start_offset > position['offset']:
+                f.seek(start_offset)
+                position['offset'] = start_offset
+            rows = (dict(zip(header, row)) for row in reader)
+        else:
+            if start_offset:
+                f.seek(start_offset)
+                position['offset'] = start_offset
+            rows = (json.loads(line) for line in lines if line.strip())
+
+        chunk = []
+        for record in rows:
+            chunk.append(record)
+            if len(chunk) >= chunk_size:
+                yield chunk, position['offset']
+                chunk = []
+        if chunk:
+            yield chunk, position['offset']
+
+# --------------------------
+# Incremental output and checkpoints
+# --------------------------
+class ResultWriter:
+    """
+    Append analysis results to an NDJSON or CSV file as chunks complete.
+    """
+
+    def __init__(self, output_path, output_format, append):
+        self.output_format = output_format
+        self.file = open(output_path, 'a' if append else 'w', newline='', encoding='utf-8')
+        self.csv_writer = None
+        self.write_header = self.file.tell() == 0
+
+    def write(self, records, analyses):
+        for record, analysis in zip(records, analyses):
+            if self.output_format == 'ndjson':
+                self.file.write(json.dumps({**analysis, 'record': record}) + '\n')
+                continue
+
+            if self.csv_writer is None:
+                fieldnames = list(record.keys()) + RESULT_FIELDS
+                self.csv_writer = csv.DictWriter(self.file, fieldnames=fieldnames, extrasaction='ignore')
+                if self.write_header:
+                    self.csv_writer.writeheader()
+            row = dict(record)
+            row['most_similar_term'] = analysis['most_similar_term']
+            row['similarity_score'] = analysis['similarity_score']
+            row['all_detected_terms'] = json.dumps(analysis['all_detected_terms'])
+            row['term_sets'] = json.dumps(analysis['term_sets'])
+            self.csv_writer.writerow(row)
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+def read_checkpoint(checkpoint_path, input_path):
+    """
+    Return the byte offset to resume from, or 0 if there is no usable checkpoint.
+    """
+    try:
+        with open(checkpoint_path) as f:
+            checkpoint = json.load(f)
+    except (OSError, ValueError):
+        return 0
+    if checkpoint.get('input') != os.path.abspath(input_path):
+        print(f"Checkpoint {checkpoint_path} is for a different input, starting from the beginning")
+        return 0
+    return int(checkpoint.get('offset', 0))
+
+def write_checkpoint(checkpoint_path, input_path, offset, rows):
+    """
+    Atomically record the input byte offset up to which results are written.
+    """
+    tmp_path = checkpoint_path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump({'input': os.path.abspath(input_path), 'offset': offset, 'rows': rows}, f)
+    os.replace(tmp_path, checkpoint_path)
+
+# --------------------------
+# Main
+# --------------------------
+def detect_format(path):
+    """Guess csv/ndjson from the file extension"""
+    return 'ndjson' if path.lower().endswith(('.ndjson', '.jsonl', '.json')) else 'csv'
+
+def run(args):
+    input_format = args.input_format or detect_format(args.input)
+    output_format = args.output_format or detect_format(args.output)
+    checkpoint_path = args.checkpoint or args.output + '.offset'
+
+    start_offset = args.start_offset
+    if args.resume and start_offset is None:
+        start_offset = read_checkpoint(checkpoint_path, args.input)
+    start_offset = start_offset or 0
+    append = start_offset > 0
+
+    print(f"Bulk analysis: {args.input} ({input_format}) -> {args.output} ({output_format})")
+    print(f"Workers: {args.workers}, chunk size: {args.chunk_size}, start offset: {start_offset}")
+
+    writer = ResultWriter(args.output, output_format, append)
+    context = multiprocessing.get_context('spawn')
+    pool = context.Pool(
+        processes=args.workers,
+        initializer=_init_worker,
+        initargs=(args.model, args.terms, args.threshold, args.term_sets_config, args.term_set,
+                  args.threads_per_worker, args.max_windows, args.window_overlap)
+    )
+
+    # Bounded window of in-flight chunks keeps memory independent of input size
+    max_pending = args.workers * 2
+    pending = deque()
+    rows_read = 0
+    rows_written = 0
+    rows_skipped = 0
+    started = time.perf_counter()
+
+    def drain_one():
+        nonlocal rows_written
+        async_result, records, end_offset = pending.popleft()
+        writer.write(records, async_result.get())
+        rows_written += len(records)
+        write_checkpoint(checkpoint_path, args.input, end_offset, rows_written)
+
+    try:
+        for chunk, end_offset in iter_chunks(args.input, input_format, args.chunk_size, start_offset):
+            rows_read += len(chunk)
+            # A valid NDJSON line need not be an object (arrays, scalars), and
+            # its field need not be a string - skip those
+            objects = [record for record in chunk if isinstance(record, dict)]
+            records = [record for record in objects if isinstance(record.get(args.field), str)]
+            rows_skipped += len(chunk) - len(records)
+            records = [record for record in records if record[args.field]]
+            texts = [record[args.field] for record in records]
+            pending.append((pool.apply_async(_analyze_chunk, (texts,)), records, end_offset))
+
+            if len(pending) >= max_pending:
+                drain_one()
+                elapsed = time.perf_counter() - started
+                print(f"Processed {rows_written} rows ({rows_written / elapsed:.1f} rows/s)")
+
+        while pending:
+            drain_one()
+    finally:
+        pool.terminate()
+        writer.close()
+
+    elapsed = time.perf_counter() - started
+    print(f"✅ Done: read {rows_read} rows, wrote {rows_written} results in {elapsed:.1f}s "
+          f"({rows_written / elapsed if elapsed else 0:.1f} rows/s)")
+    if rows_skipped:
+        print(f"   Skipped {rows_skipped} records that are not objects with a string '{args.field}'")
+    print(f"   Checkpoint: {checkpoint_path}")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Bulk-analyze exported search logs for sensitive terms")
+    parser.add_argument('input', help="Input file (CSV or NDJSON)")
+    parser.add_argument('output', help="Output file (NDJSON or CSV)")
+    parser.add_argument('--input-format', choices=['csv', 'ndjson'], help="Default: from file extension")
+    parser.add_argument('--output-format', choices=['csv', 'ndjson'], help="Default: from file extension")
+    parser.add_argument('--field', default='SearchQueryText', help="Field containing the text to analyze")
+    parser.add_argument('--terms', default=DEFAULT_TERMS_PATH, help="Sensitive terms CSV with a 'term' column")
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD, help="Threshold for --terms")
+    parser.add_argument('--term-sets-config', help="JSON term sets config (overrides --terms/--threshold)")
+    parser.add_argument('--term-set', action='append', help="Only score against this term set (repeatable)")
+    parser.add_argument('--model', default=EMBEDDING_MODEL_PATH, help="Local sentence transformer model path")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--threads-per-worker', type=int, default=1,
+                        help="Torch threads per worker (keep workers x threads <= cores)")
+    parser.add_argument('--chunk-size', type=int, default=512, help="Records per chunk sent to a worker")
+    parser.add_argument('--max-windows', type=int, default=0,
+                        help="Long-text mode: score long texts as up to N overlapping windows (0 = off)")
+    parser.add_argument('--window-overlap', type=int, default=DEFAULT_WINDOW_OVERLAP,
+                        help="Tokens shared by consecutive windows")
+    parser.add_argument('--start-offset', type=int, help="Byte offset in the input to start from")
+    parser.add_argument('--resume', action='store_true', help="Resume from the checkpoint file")
+    parser.add_argument('--checkpoint', help="Checkpoint file (default: <output>.offset)")
+    return parser.parse_args(argv)
+
+if __name__ == "__main__":
+    run(parse_args())
@@ -0,0 +1,298 @@
+"""
+Coordination between service replicas for scheduled Splunk pulls.
+
+Every replica runs the same cron. For each interval one replica wins the
+dispatch lease, dispatches the saved search and publishes the job's result
+offsets as shards; all replicas then claim shards and process them. Shard
+claims are leases: the owner renews the lease and records its progress
+while it works, and a shard whose owner stops renewing is handed to another
+replica after the lease expires, resuming from the last recorded offset.
+Every claim counts as an attempt; a shard that keeps failing is marked
+failed after max_attempts claims instead of blocking the interval forever.
+
+Backends implement CoordinationBackend. SQLiteCoordinator uses a SQLite file
+on a volume shared by all replicas.
+"""
+import sqlite3
+import time
+
+# Claims of a shard (including takeovers) before it is marked failed
+DEFAULT_MAX_ATTEMPTS = 3
+
+class CoordinationBackend:
+    """
+    Lease and shard-queue operations used by the scheduled pull.
+    """
+
+    def acquire_lease(self, name, owner, ttl):
+        """Take or renew lease `name` for `owner`. Returns True if held."""
+        raise NotImplementedError
+
+    def release_lease(self, name, owner):
+        """Release lease `name` if `owner` holds it"""
+        raise NotImplementedError
+
+    def publish_interval(self, interval_id, sid, total, shard_size, dispatcher):
+        """Record a dispatched search job and split its results into shards"""
+        raise NotImplementedError
+
+    def get_interval(self, interval_id):
+        """Published interval as a dict, or None if not dispatched yet"""
+        raise NotImplementedError
+
+    def claim_shard(self, owner, ttl, since, max_attempts=DEFAULT_MAX_ATTEMPTS):
+        """
+        Claim the oldest pending shard (or one whose lease expired) published
+        after `since`. Expired shards that already had max_attempts claims
+        are marked failed instead. Returns the shard as a dict, or None.
+        """
+        raise NotImplementedError
+
+    def update_shard_progress(self, interval_id, shard_id, owner, next_offset, ttl):
+        """Record progress and renew the shard lease. False if the lease was lost."""
+        raise NotImplementedError
+
+    def complete_shard(self, interval_id, shard_id, owner, next_offset):
+        """Mark a shard done. False if the lease was lost."""
+        raise NotImplementedError
+
+    def fail_shard(self, interval_id, shard_id, owner, next_offset, max_attempts=DEFAULT_MAX_ATTEMPTS):
+        """
+        Give up the owner's claim after an error: the shard goes back to
+        pending, or to failed once it has been claimed max_attempts times.
+        Returns the new status, or None if the lease was lost.
+        """
+        raise NotImplementedError
+
+    def count_open_shards(self, since):
+        """Number of shards published after `since` that are neither done nor failed"""
+        raise NotImplementedError
+
+    def status(self, since):
+        """Per-interval shard counts for intervals published after `since`"""
+        raise NotImplementedError
+
+class SQLiteCoordinator(CoordinationBackend):
+    """
+    Coordination backend on a shared SQLite file. Every operation runs in its
+    own short BEGIN IMMEDIATE transaction, so claims are atomic across
+    processes and hosts that share the file.
+    """
+
+    SCHEMA = [
+        """CREATE TABLE IF NOT EXISTS leases (
+            name TEXT PRIMARY KEY,
+            owner TEXT NOT NULL,
+            expires_at REAL NOT NULL
+        )""",
+        """CREATE TABLE IF NOT EXISTS intervals (
+            interval_id TEXT PRIMARY KEY,
+            sid TEXT NOT NULL,
+            total INTEGER NOT NULL,
+            dispatcher TEXT NOT NULL,
+            published_at REAL NOT NULL
+        )""",
+        """CREATE TABLE IF NOT EXISTS shards (
+            interval_id TEXT NOT NULL,
+            shard_id INTEGER NOT NULL,
+            sid TEXT NOT NULL,
+            start_offset INTEGER NOT NULL,
+            end_offset INTEGER NOT NULL,
+            next_offset INTEGER NOT NULL,
+            status TEXT NOT NULL,
+            owner TEXT,
+            lease_expires REAL,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            created_at REAL NOT NULL,
+            completed_at REAL,
+            PRIMARY KEY (interval_id, shard_id)
+        )""",
+        "CREATE INDEX IF NOT EXISTS shards_by_status ON shards (status, created_at)",
+    ]
+
+    def __init__(self, path, timeout=30):
+        self.path = path
+        self.timeout = timeout
+        conn = self._connect()
+        try:
+            for statement in self.SCHEMA:
+                conn.execute(statement)
+        finally:
+            conn.close()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _transaction(self, func):
+        """Run func(conn) inside BEGIN IMMEDIATE ... COMMIT"""
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = func(conn)
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+            return result
+        finally:
+            conn.close()
+
+    def acquire_lease(self, name, owner, ttl):
+        def acquire(conn):
+            now = time.time()
+            row = conn.execute("SELECT owner, expires_at FROM leases WHERE name = ?", (name,)).fetchone()
+            if row and row['owner'] != owner and row['expires_at'] > now:
+                return False
+            conn.execute(
+                "INSERT OR REPLACE INTO leases (name, owner, expires_at) VALUES (?, ?, ?)",
+                (name, owner, now + ttl)
+            )
+            return True
+        return self._transaction(acquire)
+
+    def release_lease(self, name, owner):
+        self._transaction(lambda conn: conn.execute(
+            "DELETE FROM leases WHERE name = ? AND owner = ?", (name, owner)
+        ))
+
+    def publish_interval(self, interval_id, sid, total, shard_size, dispatcher):
+        def publish(conn):
+            now = time.time()
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO intervals (interval_id, sid, total, dispatcher, published_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (interval_id, sid, total, dispatcher, now)
+            )
+            if cursor.rowcount == 0:
+                return False
+            for shard_id, start in enumerate(range(0, total, shard_size)):
+                conn.execute(
+                    "INSERT INTO shards (interval_id, shard_id, sid, start_offset, end_offset, "
+                    "next_offset, status, created_at) VALUES (?, ?, ?, ?, ?, ?, 'pending', ?)",
+                    (interval_id, shard_id, sid, start, min(start + shard_size, total), start, now)
+                )
+            return True
+        return self._transaction(publish)
+
+    def get_interval(self, interval_id):
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT * FROM intervals WHERE interval_id = ?", (interval_id,)).fetchone()
+            return dict(row) if row else None
+        finally:
+            conn.close()
+
+    def claim_shard(self, owner, ttl, since, max_attempts=DEFAULT_MAX_ATTEMPTS):
+        def claim(conn):
+            now = time.time()
+            conn.execute(
+                "UPDATE shards SET status = 'failed', completed_at = ? WHERE created_at >= ? AND "
+                "status = 'claimed' AND lease_expires < ? AND attempts >= ?",
+                (now, since, now, max_attempts)
+            )
+            row = conn.execute(
+                "SELECT * FROM shards WHERE created_at >= ? AND "
+                "(status = 'pending' OR (status = 'claimed' AND lease_expires < ?)) "
+                "ORDER BY created_at, shard_id LIMIT 1",
+                (since, now)
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                "UPDATE shards SET status = 'claimed', owner = ?, lease_expires = ?, attempts = attempts + 1 "
+                "WHERE interval_id = ? AND shard_id = ?",
+                (owner, now + ttl, row['interval_id'], row['shard_id'])
+            )
+            shard = dict(row)
+            shard['previous_owner'] = shard['owner']
+            shard['owner'] = owner
+            shard['attempts'] += 1
+            return shard
+        return self._transaction(claim)
+
+    def update_shard_progress(self, interval_id, shard_id, owner, next_offset, ttl):
+        def update(conn):
+            cursor = conn.execute(
+                "UPDATE shards SET next_offset = ?, lease_expires = ? "
+                "WHERE interval_id = ? AND shard_id = ? AND owner = ? AND status = 'claimed'",
+                (next_offset, time.time() + ttl, interval_id, shard_id, owner)
+            )
+            return cursor.rowcount == 1
+        return self._transaction(update)
+
+    def complete_shard(self, interval_id, shard_id, owner, next_offset):
+        def complete(conn):
+            cursor = conn.execute(
+                "UPDATE shards SET status = 'done', next_offset = ?, completed_at = ? "
+                "WHERE interval_id = ? AND shard_id = ? AND owner = ? AND status = 'claimed'",
+                (next_offset, time.time(), interval_id, shard_id, owner)
+            )
+            return cursor.rowcount == 1
+        return self._transaction(complete)
+
+    def fail_shard(self, interval_id, shard_id, owner, next_offset, max_attempts=DEFAULT_MAX_ATTEMPTS):
+        def fail(conn):
+            row = conn.execute(
+                "SELECT attempts FROM shards WHERE interval_id = ? AND shard_id = ? AND owner = ? "
+                "AND status = 'claimed'",
+                (interval_id, shard_id, owner)
+            ).fetchone()
+            if row is None:
+                return None
+            status = 'failed' if row['attempts'] >= max_attempts else 'pending'
+            conn.execute(
+                "UPDATE shards SET status = ?, next_offset = ?, lease_expires = NULL, completed_at = ? "
+                "WHERE interval_id = ? AND shard_id = ?",
+                (status, next_offset, time.time() if status == 'failed' else None, interval_id, shard_id)
+            )
+            return status
+        return self._transaction(fail)
+
+    def count_open_shards(self, since):
+        conn = self._connect()
+        try:
+            return conn.execute(
+                "SELECT COUNT(*) FROM shards WHERE created_at >= ? AND status NOT IN ('done', 'failed')", (since,)
+            ).fetchone()[0]
+        finally:
+            conn.close()
+
+    def status(self, since):
+        conn = self._connect()
+        try:
+            rows = conn.execute(
+                "SELECT i.interval_id, i.sid, i.total, i.dispatcher, s.status, COUNT(s.shard_id) AS shards "
+                "FROM intervals i LEFT JOIN shards s ON s.interval_id = i.interval_id "
+                "WHERE i.published_at >= ? GROUP BY i.interval_id, s.status ORDER BY i.interval_id",
+                (since,)
+            ).fetchall()
+        finally:
+            conn.close()
+
+        intervals = {}
+        for row in rows:
+            interval = intervals.setdefault(row['interval_id'], {
+                "interval_id": row['interval_id'],
+                "sid": row['sid'],
+                "total_results": row['total'],
+                "dispatcher": row['dispatcher'],
+                "shards": {}
+            })
+            if row['status']:
+                interval['shards'][row['status']] = row['shards']
+        return list(intervals.values())
+
+def create_coordinator(backend_url):
+    """
+    Build a coordination backend from a URL such as
+    sqlite:////shared/coordination.db. Returns None when backend_url is empty
+    (single-replica mode).
+    """
+    if not backend_url:
+        return None
+    if backend_url.startswith('sqlite:///'):
+        return SQLiteCoordinator(backend_url[len('sqlite:///'):])
+    raise ValueError(f"Unsupported coordination backend: {backend_url}")
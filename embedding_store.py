@@ -0,0 +1,439 @@
+"""
+Append-only, memory-mapped store of query embeddings for "who else searched
+for something like this?" lookups.
+
+The store is a directory of segments plus a manifest.json. Each segment has
+three files:
+    segment-NNNNNN.vec   unit-normalized float16 vectors, one row per query
+    segment-NNNNNN.rec   fixed-size records (time, metadata offset/length, user hash)
+    segment-NNNNNN.meta  one JSON line per query: query text, user, top term
+
+New rows go to the single active segment. It is sealed once it reaches
+segment_rows (batches are split at that limit) or spans segment_seconds.
+Sealed segments are immutable. The manifest is only rewritten when a segment
+is created, sealed or compacted; the active segment's row count and time
+range are rebuilt from its files at startup.
+Searches memory-map only the segments whose time range overlaps the filter
+and scan them in fixed-size blocks, so memory does not grow with history.
+compact() applies retention and merges small sealed segments; the files of
+merged segments are deleted once no search that may still read them is running.
+"""
+import heapq
+import json
+import os
+import threading
+import time
+import zlib
+
+import numpy as np
+
+RECORD_DTYPE = np.dtype([
+    ('time', '<i8'),
+    ('meta_offset', '<i8'),
+    ('meta_length', '<i4'),
+    ('user_hash', '<u4'),
+])
+VECTOR_DTYPE = np.dtype('<f2')
+
+def user_hash(user):
+    """Stable 32-bit hash used to filter by user without reading metadata"""
+    return zlib.crc32((user or '').encode('utf-8'))
+
+class Segment:
+    """
+    Files of one segment. Rows are derived from file sizes, so a torn append
+    is ignored (and truncated when the segment is reopened for writing).
+    """
+
+    def __init__(self, directory, segment_id, dim):
+        self.id = segment_id
+        self.dim = dim
+        base = os.path.join(directory, f"segment-{segment_id:06d}")
+        self.vec_path = base + '.vec'
+        self.rec_path = base + '.rec'
+        self.meta_path = base + '.meta'
+
+    def file_rows(self):
+        try:
+            vec_rows = os.path.getsize(self.vec_path) // (self.dim * VECTOR_DTYPE.itemsize)
+            rec_rows = os.path.getsize(self.rec_path) // RECORD_DTYPE.itemsize
+        except OSError:
+            return 0
+        return min(vec_rows, rec_rows)
+
+    def vectors(self, rows):
+        return np.memmap(self.vec_path, dtype=VECTOR_DTYPE, mode='r', shape=(rows, self.dim))
+
+    def records(self, rows):
+        return np.memmap(self.rec_path, dtype=RECORD_DTYPE, mode='r', shape=(rows,))
+
+    def read_metadata(self, record):
+        with open(self.meta_path, 'rb') as f:
+            f.seek(int(record['meta_offset']))
+            return json.loads(f.read(int(record['meta_length'])).decode('utf-8'))
+
+    def delete(self):
+        for path in (self.vec_path, self.rec_path, self.meta_path):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+class EmbeddingStore:
+    """
+    Thread-safe append/search over the segment directory.
+    """
+
+    def __init__(self, directory, dim, segment_rows=100000, segment_seconds=86400, retention_seconds=None):
+        self.directory = directory
+        self.dim = dim
+        self.segment_rows = segment_rows
+        self.segment_seconds = segment_seconds
+        self.retention_seconds = retention_seconds
+        self.manifest_path = os.path.join(directory, 'manifest.json')
+        self._lock = threading.Lock()
+        self._compaction_lock = threading.Lock()
+        self._active_files = None
+        self._searches_in_flight = 0
+        self._pending_deletes = []
+
+        os.makedirs(directory, exist_ok=True)
+        self._load_manifest()
+
+    # --------------------------
+    # Manifest
+    # --------------------------
+    def _load_manifest(self):
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path) as f:
+                manifest = json.load(f)
+            if manifest['dim'] != self.dim:
+                raise ValueError(f"Embedding store {self.directory} has dim {manifest['dim']}, model has {self.dim}")
+            self.segments = manifest['segments']
+            self.next_id = manifest['next_id']
+            if self.segments and not self.segments[-1]['sealed']:
+                self._refresh_from_files(self.segments[-1])
+        else:
+            self.segments = []
+            self.next_id = 1
+            self._save_manifest()
+
+    def _save_manifest(self):
+        tmp_path = self.manifest_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({"dim": self.dim, "next_id": self.next_id, "segments": self.segments}, f)
+        os.replace(tmp_path, self.manifest_path)
+
+    def _refresh_from_files(self, entry):
+        """Rebuild an active segment's row count and time range, which the manifest does not track"""
+        segment = self._segment(entry)
+        entry['rows'] = segment.file_rows()
+        if entry['rows'] == 0:
+            entry['min_time'] = entry['max_time'] = None
+            return
+        times = segment.records(entry['rows'])['time']
+        entry['min_time'], entry['max_time'] = int(times.min()), int(times.max())
+
+    def _segment(self, entry):
+        return Segment(self.directory, entry['id'], self.dim)
+
+    # --------------------------
+    # Append
+    # --------------------------
+    def _active_entry(self, now):
+        """Manifest entry of the writable segment, rolling to a new one when full or old"""
+        active = self.segments[-1] if self.segments and not self.segments[-1]['sealed'] else None
+        if active and (active['rows'] >= self.segment_rows or now - active['created_at'] >= self.segment_seconds):
+            self._seal(active)
+            active = None
+
+        if active is None:
+            active = {"id": self.next_id, "rows": 0, "min_time": None, "max_time": None,
+                      "created_at": now, "sealed": False}
+            self.next_id += 1
+            self.segments.append(active)
+            self._save_manifest()
+
+        if self._active_files is None:
+            segment = self._segment(active)
+            # Drop a partially written trailing row left by a crash
+            rows = segment.file_rows()
+            for path, row_size in ((segment.vec_path, self.dim * VECTOR_DTYPE.itemsize),
+                                   (segment.rec_path, RECORD_DTYPE.itemsize)):
+                if os.path.exists(path):
+                    os.truncate(path, rows * row_size)
+            active['rows'] = rows
+            self._active_files = tuple(open(path, 'ab') for path in
+                                       (segment.vec_path, segment.rec_path, segment.meta_path))
+        return active
+
+    def _seal(self, entry):
+        entry['sealed'] = True
+        self._close_active_files()
+
+    def _close_active_files(self):
+        if self._active_files:
+            for f in self._active_files:
+                f.close()
+        self._active_files = None
+
+    def append(self, vectors, queries, users, times, top_terms):
+        """
+        Append one row per query. vectors is a 2D array (normalized here),
+        times are epoch seconds. A batch that does not fit in the active
+        segment continues in the next one.
+        """
+        if len(queries) == 0:
+            return
+        vectors = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        vectors = (vectors / norms).astype(VECTOR_DTYPE)
+
+        with self._lock:
+            start = 0
+            while start < len(queries):
+                entry = self._active_entry(time.time())
+                end = min(len(queries), start + self.segment_rows - entry['rows'])
+                self._write_rows(entry, vectors[start:end], queries[start:end], users[start:end],
+                                 times[start:end], top_terms[start:end])
+                start = end
+                if entry['rows'] >= self.segment_rows:
+                    self._seal(entry)
+                    self._save_manifest()
+
+    def _write_rows(self, entry, vectors, queries, users, times, top_terms):
+        """Write rows to the active segment's files. Caller holds _lock."""
+        vec_file, rec_file, meta_file = self._active_files
+
+        meta_file.seek(0, os.SEEK_END)
+        offset = meta_file.tell()
+        records = np.zeros(len(queries), dtype=RECORD_DTYPE)
+        meta_lines = []
+        for i, (query, user, event_time, top_term) in enumerate(zip(queries, users, times, top_terms)):
+            line = json.dumps({"query": query, "user": user, "time": int(event_time),
+                               "top_term": top_term}).encode('utf-8') + b'\n'
+            records[i] = (int(event_time), offset, len(line), user_hash(user))
+            meta_lines.append(line)
+            offset += len(line)
+
+        # Metadata first, so every record that lands on disk points at existing bytes
+        meta_file.write(b''.join(meta_lines))
+        meta_file.flush()
+        vec_file.write(vectors.tobytes())
+        vec_file.flush()
+        rec_file.write(records.tobytes())
+        rec_file.flush()
+
+        entry['rows'] += len(queries)
+        batch_min, batch_max = int(records['time'].min()), int(records['time'].max())
+        entry['min_time'] = batch_min if entry['min_time'] is None else min(entry['min_time'], batch_min)
+        entry['max_time'] = batch_max if entry['max_time'] is None else max(entry['max_time'], batch_max)
+
+    # --------------------------
+    # Search
+    # --------------------------
+    def search(self, query_vector, k=10, user=None, earliest=None, latest=None, block_rows=65536):
+        """
+        Brute-force top-k cosine search over the segments overlapping
+        [earliest, latest], optionally restricted to one user.
+        Returns dicts with query, user, time, top_term and similarity.
+        """
+        query_vector = np.asarray(query_vector, dtype=np.float32).reshape(-1)
+        query_vector = query_vector / (np.linalg.norm(query_vector) or 1.0)
+        wanted_hash = user_hash(user) if user else None
+
+        with self._lock:
+            snapshot = [dict(entry) for entry in self.segments if entry['rows'] > 0]
+            # Compaction defers deleting files while any search is running
+            self._searches_in_flight += 1
+        try:
+            return self._search_segments(snapshot, query_vector, k, user, wanted_hash, earliest, latest, block_rows)
+        finally:
+            with self._lock:
+                self._searches_in_flight -= 1
+                deletable = self._take_deletable()
+            for entry in deletable:
+                self._segment(entry).delete()
+
+    def _search_segments(self, snapshot, query_vector, k, user, wanted_hash, earliest, latest, block_rows):
+        # Over-fetch a little so user-hash collisions can be dropped afterwards
+        keep = k * 2 if user else k
+        best = []  # min-heap of (score, segment_id, row)
+        segments = {}
+        for entry in snapshot:
+            if earliest is not None and entry['max_time'] is not None and entry['max_time'] < earliest:
+                continue
+            if latest is not None and entry['min_time'] is not None and entry['min_time'] > latest:
+                continue
+
+            segment = self._segment(entry)
+            rows = min(entry['rows'], segment.file_rows())
+            if rows == 0:
+                continue
+            segments[segment.id] = segment
+            vectors = segment.vectors(rows)
+            records = segment.records(rows)
+
+            for start in range(0, rows, block_rows):
+                end = min(start + block_rows, rows)
+                scores = np.asarray(vectors[start:end], dtype=np.float32) @ query_vector
+                block_records = records[start:end]
+                mask = np.ones(end - start, dtype=bool)
+                if earliest is not None:
+                    mask &= block_records['time'] >= earliest
+                if latest is not None:
+                    mask &= block_records['time'] <= latest
+                if wanted_hash is not None:
+                    mask &= block_records['user_hash'] == wanted_hash
+                candidates = np.flatnonzero(mask)
+                if candidates.size == 0:
+                    continue
+                if candidates.size > keep:
+                    top = np.argpartition(scores[candidates], -keep)[-keep:]
+                    candidates = candidates[top]
+                for row in candidates:
+                    item = (float(scores[row]), segment.id, start + int(row))
+                    if len(best) < keep:
+                        heapq.heappush(best, item)
+                    elif item > best[0]:
+                        heapq.heapreplace(best, item)
+
+        results = []
+        for score, segment_id, row in sorted(best, reverse=True):
+            segment = segments[segment_id]
+            metadata = segment.read_metadata(segment.records(row + 1)[row])
+            if user and metadata.get('user') != user:
+                continue
+            metadata['similarity'] = round(score, 4)
+            results.append(metadata)
+            if len(results) >= k:
+                break
+        return results
+
+    # --------------------------
+    # Compaction
+    # --------------------------
+    def compact(self):
+        """
+        Drop rows older than the retention period and merge adjacent small
+        sealed segments into segments of up to segment_rows. Runs without
+        blocking appends or searches; only the manifest swap takes the lock.
+        Returns a summary dict.
+        """
+        with self._compaction_lock:
+            cutoff = time.time() - self.retention_seconds if self.retention_seconds else None
+            with self._lock:
+                sealed = [dict(entry) for entry in self.segments if entry['sealed']]
+
+            # Runs of adjacent sealed segments that are small or hold expired
+            # rows, each run capped at segment_rows
+            groups = []
+            current, current_rows = [], 0
+            for entry in sealed + [None]:
+                candidate = entry is not None and (
+                    self._has_expired_rows(entry, cutoff) or entry['rows'] < self.segment_rows // 2
+                )
+                if not candidate or current_rows + entry['rows'] > self.segment_rows:
+                    if len(current) > 1 or any(self._has_expired_rows(e, cutoff) for e in current):
+                        groups.append(current)
+                    current, current_rows = [], 0
+                if candidate:
+                    current.append(entry)
+                    current_rows += entry['rows']
+
+            rows_dropped = 0
+            segments_removed = 0
+            for group in groups:
+                new_entry, dropped = self._merge(group, cutoff)
+                rows_dropped += dropped
+                segments_removed += len(group)
+                group_ids = {entry['id'] for entry in group}
+                with self._lock:
+                    position = next(i for i, entry in enumerate(self.segments) if entry['id'] in group_ids)
+                    self.segments = [entry for entry in self.segments if entry['id'] not in group_ids]
+                    if new_entry is not None:
+                        self.segments.insert(position, new_entry)
+                    self._save_manifest()
+                    self._pending_deletes.extend(group)
+                    deletable = self._take_deletable()
+                for entry in deletable:
+                    self._segment(entry).delete()
+
+            return {"groups_compacted": len(groups), "segments_removed": segments_removed,
+                    "rows_dropped": rows_dropped}
+
+    def _take_deletable(self):
+        """
+        Segments dropped from the manifest whose files no running search can
+        still be reading. Caller holds _lock.
+        """
+        if self._searches_in_flight:
+            return []
+        deletable, self._pending_deletes = self._pending_deletes, []
+        return deletable
+
+    @staticmethod
+    def _has_expired_rows(entry, cutoff):
+        return cutoff is not None and entry['min_time'] is not None and entry['min_time'] < cutoff
+
+    def _merge(self, group, cutoff):
+        """Write the surviving rows of a group of sealed segments into one new segment"""
+        with self._lock:
+            new_id = self.next_id
+            self.next_id += 1
+        target = Segment(self.directory, new_id, self.dim)
+
+        rows_written = 0
+        rows_dropped = 0
+        min_time, max_time = None, None
+        with open(target.vec_path, 'wb') as vec_file, open(target.rec_path, 'wb') as rec_file, \
+                open(target.meta_path, 'wb') as meta_file:
+            for entry in group:
+                segment = self._segment(entry)
+                rows = min(entry['rows'], segment.file_rows())
+                if rows == 0:
+                    continue
+                records = np.array(segment.records(rows))
+                keep = records['time'] >= cutoff if cutoff is not None else np.ones(rows, dtype=bool)
+                rows_dropped += int(rows - keep.sum())
+                if not keep.any():
+                    continue
+
+                kept_records = records[keep]
+                with open(segment.meta_path, 'rb') as source_meta:
+                    for i, record in enumerate(kept_records):
+                        source_meta.seek(int(record['meta_offset']))
+                        line = source_meta.read(int(record['meta_length']))
+                        kept_records[i]['meta_offset'] = meta_file.tell()
+                        meta_file.write(line)
+                vec_file.write(np.asarray(segment.vectors(rows))[keep].tobytes())
+                rec_file.write(kept_records.tobytes())
+
+                rows_written += len(kept_records)
+                batch_min, batch_max = int(kept_records['time'].min()), int(kept_records['time'].max())
+                min_time = batch_min if min_time is None else min(min_time, batch_min)
+                max_time = batch_max if max_time is None else max(max_time, batch_max)
+
+        if rows_written == 0:
+            target.delete()
+            return None, rows_dropped
+        return {"id": new_id, "rows": rows_written, "min_time": min_time, "max_time": max_time,
+                "created_at": min(entry['created_at'] for entry in group), "sealed": True}, rows_dropped
+
+    def stats(self):
+        with self._lock:
+            return {
+                "segments": len(self.segments),
+                "rows": sum(entry['rows'] for entry in self.segments),
+                "active_segment": self.segments[-1]['id'] if self.segments and not self.segments[-1]['sealed'] else None
+            }
+
+    def close(self):
+        """Close the active segment's files, record its final row count and delete compacted files"""
+        with self._lock:
+            self._close_active_files()
+            self._save_manifest()
+            deletable = self._take_deletable()
+        for entry in deletable:
+            self._segment(entry).delete()
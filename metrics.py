@@ -0,0 +1,141 @@
+"""
+In-process per-minute rollups of analysis results, emitted to Splunk HEC as
+metric events so dashboards can use mstats instead of scanning raw alerts.
+
+Each closed minute produces multi-measurement metric events:
+    nlp.alerts.total              all analyses in the minute
+    nlp.alerts.by_score_bucket    count per 0.1-wide score bucket (score_bucket dim)
+    nlp.alerts.by_term            count per top matched term (term dim)
+    nlp.alerts.by_source          count per sourcetype (source_type dim)
+    nlp.latency.p50/p90/p99/max   processing latency percentiles in seconds
+"""
+import random
+import threading
+import time
+
+import numpy as np
+
+# Terms beyond the busiest TOP_TERMS in a minute are rolled into "other"
+TOP_TERMS = 25
+# Latency samples kept per minute (reservoir sampling beyond this)
+MAX_LATENCY_SAMPLES = 10000
+
+def score_bucket(score):
+    """Lower bound of the 0.1-wide bucket containing score, e.g. 0.87 -> "0.8" """
+    return f"{min(int(float(score) * 10), 10) / 10:.1f}"
+
+class MinuteRollup:
+    """
+    Counters and latency samples for a single minute.
+    """
+
+    def __init__(self, minute):
+        self.minute = minute
+        self.total = 0
+        self.by_score_bucket = {}
+        self.by_term = {}
+        self.by_source = {}
+        self.latencies = []
+        self.latencies_seen = 0
+
+    def add(self, score, term, source_type, latency_seconds):
+        self.total += 1
+        bucket = score_bucket(score)
+        self.by_score_bucket[bucket] = self.by_score_bucket.get(bucket, 0) + 1
+        self.by_term[term] = self.by_term.get(term, 0) + 1
+        self.by_source[source_type] = self.by_source.get(source_type, 0) + 1
+
+        if latency_seconds is not None:
+            self.latencies_seen += 1
+            if len(self.latencies) < MAX_LATENCY_SAMPLES:
+                self.latencies.append(latency_seconds)
+            else:
+                slot = random.randrange(self.latencies_seen)
+                if slot < MAX_LATENCY_SAMPLES:
+                    self.latencies[slot] = latency_seconds
+
+    def to_hec_events(self, index, source, host=None):
+        """
+        HEC metric events (multiple-measurement format) for this minute.
+        """
+        def metric_event(fields):
+            event = {
+                "time": self.minute,
+                "event": "metric",
+                "source": source,
+                "index": index,
+                "fields": fields
+            }
+            if host:
+                event["host"] = host
+            return event
+
+        events = [metric_event({"metric_name:nlp.alerts.total": self.total})]
+
+        for bucket, count in self.by_score_bucket.items():
+            events.append(metric_event({"metric_name:nlp.alerts.by_score_bucket": count, "score_bucket": bucket}))
+
+        terms = sorted(self.by_term.items(), key=lambda item: item[1], reverse=True)
+        other = sum(count for _, count in terms[TOP_TERMS:])
+        for term, count in terms[:TOP_TERMS]:
+            events.append(metric_event({"metric_name:nlp.alerts.by_term": count, "term": term}))
+        if other:
+            events.append(metric_event({"metric_name:nlp.alerts.by_term": other, "term": "other"}))
+
+        for source_type, count in self.by_source.items():
+            events.append(metric_event({"metric_name:nlp.alerts.by_source": count, "source_type": source_type}))
+
+        if self.latencies:
+            p50, p90, p99 = np.percentile(self.latencies, [50, 90, 99])
+            events.append(metric_event({
+                "metric_name:nlp.latency.p50": float(p50),
+                "metric_name:nlp.latency.p90": float(p90),
+                "metric_name:nlp.latency.p99": float(p99),
+                "metric_name:nlp.latency.max": float(max(self.latencies)),
+                "metric_name:nlp.latency.samples": self.latencies_seen
+            }))
+        return events
+
+class MetricsRollup:
+    """
+    Thread-safe per-minute rollups. record() is called for every analysis;
+    drain() hands back the minutes that have closed.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._minutes = {}
+
+    def record(self, score, term, source_type, latency_seconds=None, now=None):
+        minute = int((now if now is not None else time.time()) // 60 * 60)
+        with self._lock:
+            rollup = self._minutes.get(minute)
+            if rollup is None:
+                rollup = self._minutes[minute] = MinuteRollup(minute)
+            rollup.add(score, term, source_type, latency_seconds)
+
+    def drain(self, include_current=False, now=None):
+        """
+        Remove and return closed minutes (and the current one if include_current).
+        """
+        current_minute = int((now if now is not None else time.time()) // 60 * 60)
+        with self._lock:
+            ready = sorted(minute for minute in self._minutes
+                           if include_current or minute < current_minute)
+            return [self._minutes.pop(minute) for minute in ready]
+
+    def restore(self, rollups):
+        """Put back rollups that could not be sent, merging into any newer data"""
+        with self._lock:
+            for rollup in rollups:
+                existing = self._minutes.get(rollup.minute)
+                if existing is None:
+                    self._minutes[rollup.minute] = rollup
+                    continue
+                existing.total += rollup.total
+                for attr in ('by_score_bucket', 'by_term', 'by_source'):
+                    target = getattr(existing, attr)
+                    for key, count in getattr(rollup, attr).items():
+                        target[key] = target.get(key, 0) + count
+                existing.latencies.extend(rollup.latencies[:MAX_LATENCY_SAMPLES - len(existing.latencies)])
+                existing.latencies_seen += rollup.latencies_seen
@@ -0,0 +1,428 @@
+"""
+Sensitive-term scoring shared by the Flask service (app.py) and the
+offline bulk analyzer (bulk_analyze.py).
+
+Only numpy is imported at module level; sentence-transformers is imported
+by load_embedding_model() so callers decide when to pay for torch.
+"""
+import csv
+import json
+import os
+import re
+import time
+from difflib import SequenceMatcher
+
+import numpy as np
+
+EMBEDDING_MODEL_PATH = "./models/all-MiniLM-L6-v2/snapshots/c9745ed1d9f207416be6d2e6f8de32d1f16199bf"
+DEFAULT_TERMS_PATH = "Suspect_Words.csv"
+DEFAULT_TERM_SET_NAME = "default"
+DEFAULT_THRESHOLD = 0.5
+DEFAULT_ENCODE_BATCH_SIZE = 64
+# Tokens shared by consecutive windows in long-text mode
+DEFAULT_WINDOW_OVERLAP = 32
+
+# --------------------------
+# Model and embeddings
+# --------------------------
+def load_embedding_model(model_path=EMBEDDING_MODEL_PATH):
+    """
+    Load the sentence transformer model from the local model directory.
+    """
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(model_path)
+
+def encode_texts(embedding_model, texts, batch_size=DEFAULT_ENCODE_BATCH_SIZE):
+    """
+    Encode a list of texts in batches. Returns a 2D array, one row per text.
+    """
+    return np.asarray(embedding_model.encode(list(texts), batch_size=batch_size))
+
+def normalize_rows(vectors):
+    """
+    Scale every row to unit length so a dot product is a cosine similarity.
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+# --------------------------
+# Enhanced similarity functions with punctuation handling
+# --------------------------
+def normalize_text(text):
+    """
+    Normalize text by removing punctuation and normalizing whitespace.
+    """
+    # Replace punctuation with spaces
+    text = re.sub(r'[^\w\s]', ' ', text.lower())
+    # Normalize multiple spaces to single space
+    text = re.sub(r'\s+', ' ', text)
+    return text.strip()
+
+def substring_similarity_normalized(query_norm, term_norm):
+    """
+    Substring similarity on texts already passed through normalize_text().
+    """
+    # Exact substring match on normalized text
+    if term_norm in query_norm:
+        return 1.0
+    
+    # Fuzzy substring match using SequenceMatcher on normalized text
+    matcher = SequenceMatcher(None, query_norm, term_norm)
+    match = matcher.find_longest_match(0, len(query_norm), 0, len(term_norm))
+    
+    if match.size > 0:
+        # Calculate similarity based on match length
+        similarity = match.size / len(term_norm)
+        return min(similarity, 1.0)
+    
+    return 0.0
+
+def word_overlap_similarity_sets(query_words, term_words):
+    """
+    Jaccard similarity of two word sets.
+    """
+    if not query_words or not term_words:
+        return 0.0
+    
+    intersection = query_words.intersection(term_words)
+    union = query_words.union(term_words)
+    
+    return len(intersection) / len(union) if union else 0.0
+
+def combine_similarity_scores(query_norm, query_words, term_norm, term_words, semantic_score):
+    """
+    Calculate enhanced similarity score combining substring, word overlap and
+    semantic similarity, for a query and term already passed through normalize_text().
+    """
+    # Get substring similarity
+    substring_score = substring_similarity_normalized(query_norm, term_norm)
+    
+    # Get word overlap similarity
+    word_overlap_score = word_overlap_similarity_sets(query_words, term_words)
+    
+    # Weighted combination: prioritize substring matches, then word overlap, then semantic
+    if substring_score > 0.8:  # Strong substring match
+        return max(substring_score, semantic_score * 0.7)
+    elif word_overlap_score > 0.6:  # Good word overlap
+        return max(word_overlap_score, semantic_score * 0.8)
+    else:  # Fall back to semantic similarity
+        return semantic_score
+
+# --------------------------
+# Term sets
+# --------------------------
+class TermSet:
+    """
+    A named sensitive-term dictionary with its own threshold, unit-normalized
+    term embeddings and a lexical index (normalized term text and word sets)
+    built once at load time.
+    """
+
+    def __init__(self, name, terms, embeddings, threshold=DEFAULT_THRESHOLD):
+        self.name = name
+        self.terms = list(terms)
+        self.threshold = threshold
+        self.embeddings = normalize_rows(embeddings)
+        self.normalized_terms = [normalize_text(term) for term in self.terms]
+        self.term_words = [set(term_norm.split()) for term_norm in self.normalized_terms]
+
+    def find_matches(self, windows, full_text_norm=None):
+        """
+        Score a query against every term. `windows` is a list of
+        (query_norm, query_words, semantic_similarities) - one entry for a
+        normal query, one per window for long texts - and each term keeps its
+        best score across windows (max-pooling).
+        For a windowed text, full_text_norm is the whole normalized text: an
+        exact substring hit anywhere in it scores 1.0, even between sampled windows.
+        Returns (term, score) tuples above threshold, highest first.
+        """
+        matches = []
+        for i, term in enumerate(self.terms):
+            if full_text_norm is not None and self.normalized_terms[i] in full_text_norm:
+                enhanced_score = 1.0
+            else:
+                enhanced_score = max(
+                    combine_similarity_scores(
+                        query_norm, query_words, self.normalized_terms[i], self.term_words[i],
+                        semantic_similarities[i]
+                    )
+                    for query_norm, query_words, semantic_similarities in windows
+                )
+            
+            if enhanced_score >= self.threshold:
+                matches.append((term, enhanced_score))
+        
+        # Sort by score (highest first)
+        matches.sort(key=lambda x: x[1], reverse=True)
+        return matches
+
+def load_terms(terms_path):
+    """
+    Load the 'term' column of a sensitive terms CSV.
+    """
+    with open(terms_path, newline='', encoding='utf-8-sig') as f:
+        return [row['term'] for row in csv.DictReader(f) if row.get('term')]
+
+def load_term_set(embedding_model, name, terms_path, threshold=DEFAULT_THRESHOLD, embeddings_path=None):
+    """
+    Load one term set. Precomputed embeddings are used when given and their
+    row count matches the term list; otherwise the terms are encoded now.
+    """
+    terms = load_terms(terms_path)
+    embeddings = None
+    if embeddings_path and os.path.exists(embeddings_path):
+        embeddings = np.load(embeddings_path)
+        if len(embeddings) != len(terms):
+            print(f"Embeddings {embeddings_path} have {len(embeddings)} rows but {terms_path} "
+                  f"has {len(terms)} terms - re-encoding")
+            embeddings = None
+    if embeddings is None:
+        embeddings = encode_texts(embedding_model, terms)
+    return TermSet(name, terms, embeddings, threshold)
+
+def load_term_sets(embedding_model, config_path=None):
+    """
+    Load the active term sets, keyed by name.
+
+    config_path points to a JSON list of term sets:
+        [{"name": "finance", "terms": "finance_terms.csv",
+          "embeddings": "finance_embeddings.npy", "threshold": 0.6, "active": true}]
+    Without a config a single "default" set is loaded from Suspect_Words.csv.
+    """
+    if not config_path:
+        config = [{"name": DEFAULT_TERM_SET_NAME, "terms": DEFAULT_TERMS_PATH}]
+    else:
+        with open(config_path) as f:
+            config = json.load(f)
+
+    term_sets = {}
+    for entry in config:
+        if not entry.get('active', True):
+            continue
+        term_set = load_term_set(
+            embedding_model,
+            entry['name'],
+            entry['terms'],
+            threshold=entry.get('threshold', DEFAULT_THRESHOLD),
+            embeddings_path=entry.get('embeddings')
+        )
+        term_sets[term_set.name] = term_set
+        print(f"Loaded term set '{term_set.name}': {len(term_set.terms)} terms, threshold {term_set.threshold}")
+    return term_sets
+
+def select_term_sets(term_sets, names=None):
+    """
+    Return the requested term sets in request order (all of them if names is empty).
+    A single name may be passed as a string. Raises ValueError for unknown
+    names or anything that is not a list of names.
+    """
+    if not names:
+        return list(term_sets.values())
+    if isinstance(names, str):
+        names = [names]
+    if not isinstance(names, (list, tuple)) or not all(isinstance(name, str) for name in names):
+        raise ValueError("term_sets must be a list of term set names")
+    unknown = [name for name in names if name not in term_sets]
+    if unknown:
+        raise ValueError(f"Unknown term set(s): {', '.join(unknown)}")
+    return [term_sets[name] for name in names]
+
+# --------------------------
+# Term matching and analysis
+# --------------------------
+def build_analysis(query_text, all_matches):
+    """
+    Build the analysis result dict returned by the service for one query.
+    """
+    if not all_matches:
+        return {
+            "query": query_text,
+            "most_similar_term": "none",
+            "similarity_score": 0.0,
+            "all_detected_terms": []
+        }
+    
+    # Get the highest scoring term
+    most_similar_term, max_similarity = all_matches[0]
+    
+    # Prepare all detected terms for the response
+    all_detected_terms = [{"term": term, "score": float(score)} for term, score in all_matches]
+
+    return {
+        "query": query_text,
+        "most_similar_term": most_similar_term,
+        "similarity_score": float(max_similarity),
+        "all_detected_terms": all_detected_terms
+    }
+
+def add_timing(timings, stage, started):
+    """
+    Add the seconds elapsed since `started` to timings[stage].
+    No-op when timings is None (timing disabled).
+    """
+    if timings is not None:
+        timings[stage] = timings.get(stage, 0.0) + (time.perf_counter() - started)
+
+# --------------------------
+# Long texts: overlapping token windows
+# --------------------------
+def _token_spans(embedding_model, text):
+    """
+    Character (start, end) span of every token in text, from the model's
+    tokenizer when it reports offsets, otherwise whitespace-separated words.
+    """
+    tokenizer = getattr(embedding_model, 'tokenizer', None)
+    if tokenizer is not None:
+        try:
+            encoding = tokenizer(text, add_special_tokens=False, return_offsets_mapping=True)
+            return list(encoding['offset_mapping'])
+        except Exception:
+            pass
+    return [match.span() for match in re.finditer(r'\S+', text)]
+
+def split_into_windows(embedding_model, text, max_windows, overlap_tokens=DEFAULT_WINDOW_OVERLAP):
+    """
+    Split text into overlapping windows that each fit the model's max
+    sequence length. At most max_windows are returned; when more would be
+    needed they are spread evenly over the text so the whole length is
+    sampled at a fixed cost. Texts that fit in one window are returned as is.
+    """
+    # Room for the [CLS]/[SEP] tokens the model adds
+    window_tokens = max(getattr(embedding_model, 'max_seq_length', None) or 256, 8) - 2
+    # Every token covers at least one character, so short texts skip tokenizing
+    if len(text) <= window_tokens or max_windows <= 1:
+        return [text]
+    
+    spans = _token_spans(embedding_model, text)
+    if len(spans) <= window_tokens:
+        return [text]
+    
+    stride = max(window_tokens - overlap_tokens, 1)
+    last_start = len(spans) - window_tokens
+    starts = list(range(0, last_start, stride)) + [last_start]
+    if len(starts) > max_windows:
+        starts = [round(i * last_start / (max_windows - 1)) for i in range(max_windows)]
+    
+    return [text[spans[start][0]:spans[start + window_tokens - 1][1]] for start in starts]
+
+def _encode_windows(embedding_model, texts, batch_size, timings, max_windows, window_overlap):
+    """
+    Split texts into windows (when max_windows > 1) and encode all windows in
+    one batch. Returns (windows per text, unit-normalized window embeddings).
+    """
+    started = time.perf_counter()
+    if max_windows > 1:
+        text_windows = [split_into_windows(embedding_model, text, max_windows, window_overlap) for text in texts]
+    else:
+        text_windows = [[text] for text in texts]
+    units = [window for windows in text_windows for window in windows]
+    add_timing(timings, 'windowing', started)
+    
+    started = time.perf_counter()
+    unit_embeddings = normalize_rows(encode_texts(embedding_model, units, batch_size=batch_size))
+    add_timing(timings, 'encode', started)
+    return text_windows, unit_embeddings
+
+def _pool_text_embeddings(text_windows, unit_embeddings):
+    """One unit-length row per text: the mean of its window embeddings"""
+    text_embeddings = []
+    first_unit = 0
+    for windows in text_windows:
+        text_embeddings.append(unit_embeddings[first_unit:first_unit + len(windows)].mean(axis=0))
+        first_unit += len(windows)
+    return normalize_rows(np.stack(text_embeddings))
+
+def embed_texts(embedding_model, texts, batch_size=DEFAULT_ENCODE_BATCH_SIZE, timings=None,
+                max_windows=0, window_overlap=DEFAULT_WINDOW_OVERLAP):
+    """
+    Text embeddings exactly as analyze_texts(..., return_embeddings=True)
+    computes them (same windowing and pooling), without scoring any term sets.
+    """
+    texts = list(texts)
+    if not texts:
+        return np.zeros((0, 0), dtype=np.float32)
+    text_windows, unit_embeddings = _encode_windows(embedding_model, texts, batch_size, timings,
+                                                    max_windows, window_overlap)
+    return _pool_text_embeddings(text_windows, unit_embeddings)
+
+# --------------------------
+# Analysis
+# --------------------------
+def analyze_texts(embedding_model, texts, term_sets, batch_size=DEFAULT_ENCODE_BATCH_SIZE, timings=None,
+                  max_windows=0, window_overlap=DEFAULT_WINDOW_OVERLAP, return_embeddings=False):
+    """
+    Analyze a list of texts against one or more TermSets in one pass.
+
+    Every text is encoded (in a single batched call) and normalized once, then
+    scored against each term set with one matrix product per set. The
+    top-level fields summarize matches across all sets; per-set results are
+    under "term_sets", keyed by set name. Returns one dict per text, in order.
+
+    With max_windows > 1 (long-text mode), texts longer than the model's max
+    sequence length are split into up to max_windows overlapping windows. All
+    windows of all texts are encoded in the same batch, and each term's score
+    is the max over the text's windows, so matches past the model's
+    truncation point are found. The window budget only limits the encoder
+    and fuzzy matching: exact substring hits are checked on the whole text.
+
+    If a timings dict is passed, seconds spent in the encode, semantic
+    (matrix product) and lexical (substring/word overlap) stages are added to it.
+
+    With return_embeddings=True, returns (results, embeddings) where
+    embeddings has one unit-length row per text (the mean of a long text's windows).
+    """
+    texts = list(texts)
+    if not texts:
+        return ([], np.zeros((0, 0), dtype=np.float32)) if return_embeddings else []
+    
+    text_windows, unit_embeddings = _encode_windows(embedding_model, texts, batch_size, timings,
+                                                    max_windows, window_overlap)
+    
+    started = time.perf_counter()
+    set_similarities = [unit_embeddings @ term_set.embeddings.T for term_set in term_sets]
+    add_timing(timings, 'semantic', started)
+    
+    started = time.perf_counter()
+    results = []
+    first_unit = 0
+    for text, windows in zip(texts, text_windows):
+        unit_rows = range(first_unit, first_unit + len(windows))
+        first_unit += len(windows)
+        normalized_windows = []
+        for window in windows:
+            window_norm = normalize_text(window)
+            normalized_windows.append((window_norm, set(window_norm.split())))
+        full_text_norm = normalize_text(text) if len(windows) > 1 else None
+        
+        all_matches = []
+        per_set = {}
+        for term_set, similarities in zip(term_sets, set_similarities):
+            scored_windows = [
+                (window_norm, window_words, similarities[row])
+                for (window_norm, window_words), row in zip(normalized_windows, unit_rows)
+            ]
+            matches = term_set.find_matches(scored_windows, full_text_norm)
+            set_analysis = build_analysis(text, matches)
+            del set_analysis['query']
+            set_analysis['threshold'] = term_set.threshold
+            per_set[term_set.name] = set_analysis
+            all_matches.extend(matches)
+        
+        # A term in several sets is reported once at the top level, with its best score
+        best_scores = {}
+        for term, score in all_matches:
+            if score > best_scores.get(term, -1.0):
+                best_scores[term] = score
+        all_matches = sorted(best_scores.items(), key=lambda x: x[1], reverse=True)
+        result = build_analysis(text, all_matches)
+        result['term_sets'] = per_set
+        if len(windows) > 1:
+            result['windows_scored'] = len(windows)
+        results.append(result)
+    add_timing(timings, 'lexical', started)
+    
+    if return_embeddings:
+        return results, _pool_text_embeddings(text_windows, unit_embeddings)
+    return results
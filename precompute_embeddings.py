@@ -1,11 +1,17 @@
 # precompute_embeddings.py
+# Usage: python precompute_embeddings.py [terms.csv] [embeddings.npy]
+# Run once per term set and reference the .npy as "embeddings" in TERM_SETS_CONFIG.
+import sys
 import numpy as np
 import pandas as pd
 from sentence_transformers import SentenceTransformer
 
+terms_path = sys.argv[1] if len(sys.argv) > 1 else "Suspect_Words.csv"
+embeddings_path = sys.argv[2] if len(sys.argv) > 2 else "sensitive_embeddings.npy"
+
 # Load sensitive terms
-print("Loading Suspect_Words.csv...")
-sensitive_terms_df = pd.read_csv("Suspect_Words.csv")
+print(f"Loading {terms_path}...")
+sensitive_terms_df = pd.read_csv(terms_path)
 print(f"Found {len(sensitive_terms_df)} sensitive terms")
 
 # Load the SAME model used in app.py (all-MiniLM-L6-v2)
@@ -25,10 +31,12 @@ print("Computing embeddings (this may take 10-30 seconds)...")
 sensitive_embeddings = np.array([get_embedding(term) for term in sensitive_terms_df['term']])
 
 # Save embeddings and terms together
-np.save("sensitive_embeddings.npy", sensitive_embeddings)
-sensitive_terms_df.to_csv("sensitive_terms_order.csv", index=False)
+np.save(embeddings_path, sensitive_embeddings)
+if embeddings_path == "sensitive_embeddings.npy":
+    sensitive_terms_df.to_csv("sensitive_terms_order.csv", index=False)
 
 print(f"✅ Success! Saved embeddings for {len(sensitive_embeddings)} terms")
-print(f"   - sensitive_embeddings.npy ({sensitive_embeddings.nbytes / 1024:.1f} KB)")
-print(f"   - sensitive_terms_order.csv (backup)")
+print(f"   - {embeddings_path} ({sensitive_embeddings.nbytes / 1024:.1f} KB)")
+if embeddings_path == "sensitive_embeddings.npy":
+    print(f"   - sensitive_terms_order.csv (backup)")
 print("Ready to rebuild Docker image!")
@@ -0,0 +1,75 @@
+"""
+On-demand sampling profiler for the NLP Alert Service.
+
+A background thread samples the Python stacks of all other threads at a
+fixed interval and aggregates them as collapsed stacks
+("outer;inner;leaf count"), the input format of flamegraph.pl and
+speedscope. Nothing runs unless a profile has been started.
+"""
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+# Leaf frames in these modules are parked threads (idle HTTP workers,
+# scheduler waits) rather than work, so their samples are dropped
+IDLE_MODULES = ('threading.py', 'selectors.py', 'socketserver.py', 'queue.py')
+
+class SamplingProfiler:
+    """
+    Sample every thread's stack every `interval` seconds until stop() is called.
+    """
+
+    def __init__(self, interval=0.005, max_depth=64, ignore_thread_ids=()):
+        self.interval = interval
+        self.max_depth = max_depth
+        self.ignore_thread_ids = set(ignore_thread_ids)
+        self.stacks = Counter()
+        self.samples = 0
+        self.started_at = None
+        self.stopped_at = None
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self.started_at = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join()
+        self.stopped_at = time.perf_counter()
+
+    def _run(self):
+        own_thread_id = threading.get_ident()
+        while not self._stop_event.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_thread_id or thread_id in self.ignore_thread_ids:
+                    continue
+                if os.path.basename(frame.f_code.co_filename) in IDLE_MODULES:
+                    continue
+
+                stack = []
+                while frame is not None and len(stack) < self.max_depth:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                    frame = frame.f_back
+                self.stacks[';'.join(reversed(stack))] += 1
+            self.samples += 1
+
+    def collapsed(self):
+        """Collapsed-stack text, most frequent stacks first"""
+        return '\n'.join(f"{stack} {count}" for stack, count in self.stacks.most_common())
+
+    def summary(self):
+        duration = (self.stopped_at or time.perf_counter()) - (self.started_at or time.perf_counter())
+        return {
+            "duration_seconds": round(duration, 3),
+            "interval_ms": self.interval * 1000,
+            "samples": self.samples,
+            "unique_stacks": len(self.stacks),
+            "collapsed": self.collapsed()
+        }
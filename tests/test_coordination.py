@@ -0,0 +1,131 @@
+"""
+SQLiteCoordinator tests: leases, shard claims, expiry/takeover and failure.
+"""
+import threading
+
+import pytest
+
+import coordination
+from coordination import SQLiteCoordinator, create_coordinator
+
+class FakeClock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def time(self):
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(coordination.time, 'time', fake.time)
+    return fake
+
+@pytest.fixture
+def coordinator(tmp_path):
+    return SQLiteCoordinator(str(tmp_path / 'coordination.db'))
+
+def test_create_coordinator(tmp_path):
+    assert create_coordinator('') is None
+    assert isinstance(create_coordinator(f"sqlite:///{tmp_path / 'c.db'}"), SQLiteCoordinator)
+    with pytest.raises(ValueError):
+        create_coordinator('redis://localhost')
+
+def test_lease_is_exclusive_until_released_or_expired(coordinator, clock):
+    assert coordinator.acquire_lease('dispatch:x', 'a', ttl=60)
+    assert not coordinator.acquire_lease('dispatch:x', 'b', ttl=60)
+    # The holder can renew
+    assert coordinator.acquire_lease('dispatch:x', 'a', ttl=60)
+
+    coordinator.release_lease('dispatch:x', 'b')  # not the holder: no-op
+    assert not coordinator.acquire_lease('dispatch:x', 'b', ttl=60)
+    coordinator.release_lease('dispatch:x', 'a')
+    assert coordinator.acquire_lease('dispatch:x', 'b', ttl=60)
+
+    clock.now += 61
+    assert coordinator.acquire_lease('dispatch:x', 'a', ttl=60)
+
+def test_publish_splits_results_into_shards_once(coordinator, clock):
+    assert coordinator.publish_interval('i1', 'sid1', total=2500, shard_size=1000, dispatcher='a')
+    assert not coordinator.publish_interval('i1', 'sid2', total=10, shard_size=1000, dispatcher='b')
+    assert coordinator.get_interval('i1')['sid'] == 'sid1'
+    assert coordinator.get_interval('i2') is None
+
+    shards = [coordinator.claim_shard('a', ttl=60, since=0) for _ in range(3)]
+    assert [(s['start_offset'], s['end_offset']) for s in shards] == [(0, 1000), (1000, 2000), (2000, 2500)]
+    assert coordinator.claim_shard('b', ttl=60, since=0) is None
+    assert coordinator.count_open_shards(since=0) == 3
+
+    for shard in shards:
+        assert coordinator.complete_shard('i1', shard['shard_id'], 'a', shard['end_offset'])
+    assert coordinator.count_open_shards(since=0) == 0
+    assert coordinator.status(since=0)[0]['shards'] == {'done': 3}
+
+def test_expired_shard_is_taken_over_from_last_progress(coordinator, clock):
+    coordinator.publish_interval('i1', 'sid1', total=1000, shard_size=1000, dispatcher='a')
+    shard = coordinator.claim_shard('a', ttl=60, since=0)
+    assert coordinator.update_shard_progress('i1', shard['shard_id'], 'a', 400, ttl=60)
+
+    # Renewed lease is still held
+    clock.now += 59
+    assert coordinator.claim_shard('b', ttl=60, since=0) is None
+
+    clock.now += 61
+    taken = coordinator.claim_shard('b', ttl=60, since=0)
+    assert taken['previous_owner'] == 'a'
+    assert taken['owner'] == 'b'
+    assert taken['next_offset'] == 400
+    assert taken['attempts'] == 2
+
+    # The previous owner can neither renew nor complete any more
+    assert not coordinator.update_shard_progress('i1', shard['shard_id'], 'a', 600, ttl=60)
+    assert not coordinator.complete_shard('i1', shard['shard_id'], 'a', 1000)
+    assert coordinator.complete_shard('i1', shard['shard_id'], 'b', 1000)
+
+def test_failed_fetch_retries_then_marks_shard_failed(coordinator, clock):
+    coordinator.publish_interval('i1', 'sid1', total=1000, shard_size=1000, dispatcher='a')
+
+    for attempt in range(1, 3):
+        shard = coordinator.claim_shard('a', ttl=60, since=0, max_attempts=3)
+        assert shard['attempts'] == attempt
+        assert coordinator.fail_shard('i1', 0, 'a', 200, max_attempts=3) == 'pending'
+
+    shard = coordinator.claim_shard('a', ttl=60, since=0, max_attempts=3)
+    assert shard['next_offset'] == 200
+    assert coordinator.fail_shard('i1', 0, 'a', 200, max_attempts=3) == 'failed'
+
+    assert coordinator.claim_shard('a', ttl=60, since=0, max_attempts=3) is None
+    assert coordinator.count_open_shards(since=0) == 0
+    assert coordinator.status(since=0)[0]['shards'] == {'failed': 1}
+    # Only the owner of a claimed shard can fail it
+    assert coordinator.fail_shard('i1', 0, 'b', 200, max_attempts=3) is None
+
+def test_expired_shard_out_of_attempts_is_marked_failed(coordinator, clock):
+    coordinator.publish_interval('i1', 'sid1', total=1000, shard_size=1000, dispatcher='a')
+    coordinator.claim_shard('a', ttl=60, since=0, max_attempts=1)
+
+    clock.now += 61
+    assert coordinator.claim_shard('b', ttl=60, since=0, max_attempts=1) is None
+    assert coordinator.count_open_shards(since=0) == 0
+
+def test_concurrent_claims_hand_out_each_shard_once(tmp_path):
+    path = str(tmp_path / 'coordination.db')
+    SQLiteCoordinator(path).publish_interval('i1', 'sid1', total=50, shard_size=1, dispatcher='a')
+    claimed = []
+
+    def worker(owner):
+        replica = SQLiteCoordinator(path)
+        while True:
+            shard = replica.claim_shard(owner, ttl=60, since=0)
+            if shard is None:
+                return
+            claimed.append(shard['shard_id'])
+            replica.complete_shard('i1', shard['shard_id'], owner, shard['end_offset'])
+
+    threads = [threading.Thread(target=worker, args=(f"r{i}",)) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(claimed) == list(range(50))
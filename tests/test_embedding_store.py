@@ -0,0 +1,129 @@
+"""
+EmbeddingStore tests: append, search, segment rollover, restart and compaction.
+"""
+import json
+import os
+import time
+
+import numpy as np
+
+from embedding_store import EmbeddingStore
+
+DIM = 4
+NOW = int(time.time())
+
+def unit(i):
+    vector = np.zeros(DIM, dtype=np.float32)
+    vector[i % DIM] = 1.0
+    return vector
+
+def append_rows(store, n, first=0, user='alice', event_time=NOW):
+    store.append(
+        np.stack([unit(i) for i in range(first, first + n)]),
+        [f"query {i}" for i in range(first, first + n)],
+        [user] * n,
+        [event_time] * n,
+        ['none'] * n
+    )
+
+def manifest(directory):
+    with open(os.path.join(directory, 'manifest.json')) as f:
+        return json.load(f)
+
+def test_search_returns_nearest_rows_with_filters(tmp_path):
+    store = EmbeddingStore(str(tmp_path), DIM)
+    append_rows(store, 8, user='alice', event_time=NOW - 100)
+    append_rows(store, 4, first=8, user='bob', event_time=NOW)
+
+    matches = store.search(unit(1), k=3)
+    assert len(matches) == 3
+    assert all(match['similarity'] == 1.0 for match in matches)
+    assert {match['query'] for match in matches} <= {'query 1', 'query 5', 'query 9'}
+
+    bob = store.search(unit(1), k=5, user='bob')
+    assert [match['query'] for match in bob][0] == 'query 9'
+    assert {match['user'] for match in bob} == {'bob'}
+
+    recent = store.search(unit(1), k=5, earliest=NOW - 10)
+    assert {match['user'] for match in recent} == {'bob'}
+    assert store.search(unit(1), k=5, latest=NOW - 1000) == []
+
+def test_batches_are_split_at_segment_limit(tmp_path):
+    store = EmbeddingStore(str(tmp_path), DIM, segment_rows=4)
+    append_rows(store, 6)
+    append_rows(store, 5, first=6)
+
+    rows = [entry['rows'] for entry in store.segments]
+    assert rows == [4, 4, 3]
+    assert [entry['sealed'] for entry in store.segments] == [True, True, False]
+    assert len(store.search(unit(0), k=20)) == 11
+
+def test_manifest_is_only_saved_on_rollover(tmp_path):
+    store = EmbeddingStore(str(tmp_path), DIM, segment_rows=100)
+    append_rows(store, 1)
+    path = os.path.join(str(tmp_path), 'manifest.json')
+    os.utime(path, ns=(0, 0))
+
+    append_rows(store, 3, first=1)
+    assert os.stat(path).st_mtime_ns == 0
+    assert manifest(str(tmp_path))['segments'][0]['rows'] == 0
+
+    store.close()
+    assert manifest(str(tmp_path))['segments'][0]['rows'] == 4
+
+def test_active_segment_is_rebuilt_from_files_on_restart(tmp_path):
+    store = EmbeddingStore(str(tmp_path), DIM)
+    append_rows(store, 5, event_time=NOW - 50)
+    # Simulate a crash: the manifest still describes an empty active segment
+    store._close_active_files()
+
+    reopened = EmbeddingStore(str(tmp_path), DIM)
+    active = reopened.segments[-1]
+    assert active['rows'] == 5
+    assert active['min_time'] == active['max_time'] == NOW - 50
+    assert len(reopened.search(unit(0), k=10, earliest=NOW - 60)) == 5
+
+    append_rows(reopened, 2, first=5)
+    assert reopened.stats()['rows'] == 7
+
+def test_compaction_applies_retention_and_merges_small_segments(tmp_path):
+    store = EmbeddingStore(str(tmp_path), DIM, segment_rows=10, retention_seconds=3600)
+    append_rows(store, 10, event_time=NOW - 7200)
+    append_rows(store, 10, first=10, event_time=NOW)
+    append_rows(store, 3, first=20, event_time=NOW)
+    store.segments[-1]['sealed'] = True
+    store._close_active_files()
+    append_rows(store, 2, first=23, event_time=NOW)
+    store.segments[-1]['sealed'] = True
+    store._close_active_files()
+    old_files = {entry['id'] for entry in store.segments}
+
+    summary = store.compact()
+
+    assert summary['rows_dropped'] == 10
+    assert [entry['rows'] for entry in store.segments] == [10, 5]
+    assert store.stats()['rows'] == 15
+    assert {match['query'] for match in store.search(unit(0), k=20)} == {f"query {i}" for i in range(10, 25)}
+    remaining = {name for name in os.listdir(str(tmp_path)) if name.startswith('segment-')}
+    for segment_id in old_files - {entry['id'] for entry in store.segments}:
+        assert f"segment-{segment_id:06d}.meta" not in remaining
+
+def test_compaction_defers_deleting_files_of_running_searches(tmp_path):
+    store = EmbeddingStore(str(tmp_path), DIM, segment_rows=10)
+    for first in (0, 2):
+        append_rows(store, 2, first=first)
+        store.segments[-1]['sealed'] = True
+        store._close_active_files()
+    merged_ids = [entry['id'] for entry in store.segments]
+
+    # A search has snapshotted the manifest and is still scanning
+    store._searches_in_flight += 1
+    store.compact()
+    for segment_id in merged_ids:
+        assert os.path.exists(os.path.join(str(tmp_path), f"segment-{segment_id:06d}.meta"))
+
+    # The next search to finish deletes them
+    store._searches_in_flight -= 1
+    assert len(store.search(unit(0), k=10)) == 4
+    for segment_id in merged_ids:
+        assert not os.path.exists(os.path.join(str(tmp_path), f"segment-{segment_id:06d}.meta"))
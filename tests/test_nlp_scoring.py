@@ -0,0 +1,62 @@
+"""
+Scoring tests with a stub embedding model (no sentence-transformers needed).
+"""
+import numpy as np
+import pytest
+
+from nlp_scoring import TermSet, analyze_texts, select_term_sets
+
+class StubModel:
+    """Encodes every text as the same vector, so only lexical matching scores"""
+    max_seq_length = 16
+
+    def encode(self, texts, batch_size=32):
+        return np.tile([0.0, 1.0], (len(texts), 1))
+
+def lexical_term_set(name, terms, threshold=0.5):
+    # Term embeddings orthogonal to StubModel's, so semantic similarity is 0
+    return TermSet(name, terms, np.tile([1.0, 0.0], (len(terms), 1)), threshold)
+
+def test_term_in_several_sets_reported_once_with_best_score():
+    finance = lexical_term_set('finance', ['payroll'])
+    hr = lexical_term_set('hr', ['payroll', 'salary'])
+
+    result = analyze_texts(StubModel(), ['export payroll salary'], [finance, hr])[0]
+
+    terms = [match['term'] for match in result['all_detected_terms']]
+    assert sorted(terms) == ['payroll', 'salary']
+    assert result['term_sets']['finance']['most_similar_term'] == 'payroll'
+    assert len(result['term_sets']['hr']['all_detected_terms']) == 2
+
+def test_select_term_sets_accepts_single_name():
+    term_sets = {'finance': lexical_term_set('finance', ['payroll']), 'hr': lexical_term_set('hr', ['salary'])}
+
+    assert select_term_sets(term_sets, 'hr') == [term_sets['hr']]
+    assert select_term_sets(term_sets, ['hr', 'finance']) == [term_sets['hr'], term_sets['finance']]
+    assert select_term_sets(term_sets, None) == list(term_sets.values())
+
+def test_select_term_sets_rejects_bad_names():
+    term_sets = {'finance': lexical_term_set('finance', ['payroll'])}
+
+    with pytest.raises(ValueError, match='Unknown term set'):
+        select_term_sets(term_sets, ['finance', 'legal'])
+    with pytest.raises(ValueError, match='must be a list'):
+        select_term_sets(term_sets, {'name': 'finance'})
+    with pytest.raises(ValueError, match='must be a list'):
+        select_term_sets(term_sets, [['finance']])
+
+def test_long_text_mode_finds_exact_term_between_sampled_windows():
+    # 53 words, 14-token windows: with a budget of 3 the windows cover words
+    # 0-13, 20-33 and 39-52, so "payroll" at word 16 is in a gap
+    words = ['text'] * 53
+    words[16] = 'payroll'
+    text = ' '.join(words)
+    term_set = lexical_term_set('finance', ['payroll'])
+
+    full = analyze_texts(StubModel(), [text], [term_set], max_windows=0)[0]
+    windowed = analyze_texts(StubModel(), [text], [term_set], max_windows=3, window_overlap=0)[0]
+
+    assert full['most_similar_term'] == 'payroll'
+    assert windowed['windows_scored'] == 3
+    assert windowed['most_similar_term'] == 'payroll'
+    assert windowed['similarity_score'] == 1.0